@@ -2,6 +2,8 @@ from golem_cloud.transaction import (
     Result,
     Operation,
     operation,
+    BatchOperation,
+    batch_operation,
     InfallibleTransaction,
     infallible_transaction,
 )
@@ -15,15 +17,34 @@ def delete_account(account_id: int) -> Result[None, str]:
     raise NotImplementedError("TODO: Delete the account")
 
 
+def bulk_create_accounts(accounts: list[tuple[str, str]]) -> Result[list[int], str]:
+    raise NotImplementedError("TODO: Create the accounts with a single request")
+
+
+def bulk_delete_accounts(account_ids: list[int]) -> Result[None, str]:
+    raise NotImplementedError("TODO: Delete the accounts with a single request")
+
+
 create_account_op: Operation[tuple[str, str], int, str] = operation(
     lambda args: create_account(args[0], args[1]),
     lambda _, account_id: delete_account(account_id),
 )
 
 
+bulk_create_accounts_op: BatchOperation[tuple[str, str], int, str] = batch_operation(
+    bulk_create_accounts,
+    lambda _, account_ids: bulk_delete_accounts(account_ids),
+    batch_size=1000,
+)
+
+
 def create_accounts(tx: InfallibleTransaction) -> None:
     tx.execute(create_account_op, ("foo", "foo@golem.com"))
     tx.execute(create_account_op, ("bar", "bar@golem.com"))
+    tx.execute_batch(
+        bulk_create_accounts_op,
+        [(f"user{i}", f"user{i}@golem.com") for i in range(10_000)],
+    )
 
 
 infallible_transaction(create_accounts)
@@ -0,0 +1,296 @@
+"""
+Parallel reading and streamed writing of wasi:blobstore objects.
+
+Requires the following imports in the wit to work:
+* import wasi:blobstore/blobstore;
+* import wasi:blobstore/container;
+* import wasi:io/poll@0.2.3;
+* import wasi:io/streams@0.2.3;
+"""
+
+from typing import Callable, Iterable, Iterator, Self
+from wit_world.types import Err
+from wit_world.imports import blobstore, poll
+from wit_world.imports.container import Container
+from wit_world.imports.streams import OutputStream, StreamError_Closed
+from wit_world.imports.wasi_blobstore_types import OutgoingValue
+from .streams import DEFAULT_CHUNK_SIZE, ChunkedWriter
+
+DEFAULT_RANGE_SIZE = 4 * 1024 * 1024
+DEFAULT_CONCURRENCY = 4
+
+
+def read_blob(
+    container: Container | str,
+    name: str,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> bytearray:
+    """
+    Reads a whole object, fetching up to `concurrency` ranges of `range_size` bytes at the same time
+    into a buffer of the size of the object.
+
+    Raises: `wit_world.types.Err(str)`, or `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+    if reading a range failed
+    """
+    container = _container(container)
+    size = container.object_info(name).size
+    data = bytearray(size)
+    view = memoryview(data)
+    ranges = _ranges(size, range_size)
+    for _ in _fetch_ranges(
+        container,
+        name,
+        ranges,
+        lambda start, length: view[start : start + length],
+        concurrency,
+        ordered=False,
+    ):
+        pass
+    return data
+
+
+def iter_blob(
+    container: Container | str,
+    name: str,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Iterator[memoryview]:
+    """
+    Yields the contents of an object in order, in ranges of `range_size` bytes. Up to `concurrency` ranges
+    following the last yielded one are fetched at the same time, so at most `concurrency` ranges are held
+    in memory.
+
+    Raises: `wit_world.types.Err(str)`, or `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+    if reading a range failed
+    """
+    container = _container(container)
+    ranges = _ranges(container.object_info(name).size, range_size)
+    for _, buffer in _fetch_ranges(
+        container,
+        name,
+        ranges,
+        lambda start, length: memoryview(bytearray(length)),
+        concurrency,
+        ordered=True,
+    ):
+        yield buffer
+
+
+class BlobWriter:
+    """
+    Writes an object as a stream, without holding the whole object in memory.
+
+    Written data is written to the body stream of the object in chunks of `chunk_size` bytes, buffering at
+    most one chunk and waiting for the stream whenever it does not accept more data. The object is stored
+    when the writer is closed, or when leaving its `with` block without an exception. Use `abort` to
+    discard the written data instead.
+    """
+
+    def __init__(
+        self,
+        container: Container | str,
+        name: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        self.container = _container(container)
+        self.name = name
+        self.chunk_size = chunk_size
+        self._outgoing: OutgoingValue | None = OutgoingValue.new_outgoing_value()
+        try:
+            self._stream: OutputStream | None = (
+                self._outgoing.outgoing_value_write_body()
+            )
+        except BaseException:
+            self.abort()
+            raise
+        self._writer: ChunkedWriter | None = ChunkedWriter(self._stream, chunk_size)
+        self._written = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._outgoing is None
+
+    def tell(self) -> int:
+        """
+        The number of bytes written so far.
+        """
+        return self._written
+
+    def write(self, data: bytes | bytearray | memoryview) -> int:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+        """
+        written = self._open_writer().write(data)
+        self._written += written
+        return written
+
+    def writelines(self, lines: Iterable[bytes | bytearray | memoryview]) -> None:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+        """
+        for line in lines:
+            self.write(line)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered data to the body stream.
+
+        Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+        """
+        self._open_writer().flush()
+
+    def close(self) -> None:
+        """
+        Writes the remaining buffered data and stores the object.
+
+        Raises: `wit_world.types.Err(str)`, or `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+        if writing the data failed
+        """
+        outgoing = self._outgoing
+        if outgoing is None or self._stream is None:
+            return
+        try:
+            self.flush()
+            self._drop_stream()
+            self.container.write_data(self.name, outgoing)
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        """
+        Discards the written data without storing the object.
+        """
+        if self._outgoing is not None:
+            self._drop_stream()
+            self._outgoing.__exit__(None, None, None)
+            self._outgoing = None
+
+    def _open_writer(self) -> ChunkedWriter:
+        if self._writer is None:
+            raise ValueError("Write to a closed blob writer")
+        return self._writer
+
+    def _drop_stream(self) -> None:
+        # the body stream has to be dropped before the object is stored
+        self._writer = None
+        stream = getattr(self, "_stream", None)
+        if stream is not None:
+            stream.__exit__(None, None, None)
+            self._stream = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class _RangeRead:
+    # reads a range of an object into a buffer, without blocking
+    def __init__(
+        self,
+        container: Container,
+        name: str,
+        index: int,
+        start: int,
+        buffer: memoryview,
+    ) -> None:
+        self.name = name
+        self.index = index
+        self.buffer = buffer
+        self.position = 0
+        # the end offset of get-data is inclusive
+        self.incoming = container.get_data(name, start, start + len(buffer) - 1)
+        try:
+            self.stream = self.incoming.incoming_value_consume_async()
+        except BaseException:
+            self.incoming.__exit__(None, None, None)
+            raise
+        self.pollable = self.stream.subscribe()
+
+    def read(self) -> bool:
+        # reads the available data, and returns whether the range is complete
+        buffer = self.buffer
+        try:
+            while self.position < len(buffer):
+                chunk = self.stream.read(len(buffer) - self.position)
+                if not chunk:
+                    return False
+                buffer[self.position : self.position + len(chunk)] = chunk
+                self.position += len(chunk)
+        except Err as e:
+            if not isinstance(e.value, StreamError_Closed):
+                raise
+            raise ValueError(
+                f"Object {self.name} ended {len(buffer) - self.position} bytes before the end of a range"
+            ) from None
+        return True
+
+    def close(self) -> None:
+        self.pollable.__exit__(None, None, None)
+        self.stream.__exit__(None, None, None)
+        self.incoming.__exit__(None, None, None)
+
+
+def _fetch_ranges(
+    container: Container,
+    name: str,
+    ranges: list[tuple[int, int]],
+    allocate: Callable[[int, int], memoryview],
+    concurrency: int,
+    ordered: bool,
+) -> Iterator[tuple[int, memoryview]]:
+    # Yields the index and buffer of each range once it has been read, in the order of the ranges if `ordered`,
+    # and otherwise as soon as possible. Ordered fetches only start the `concurrency` ranges following the last
+    # yielded one, so that the buffers of at most `concurrency` ranges are alive.
+    concurrency = max(concurrency, 1)
+    active: list[_RangeRead] = []
+    done: dict[int, memoryview] = {}
+    started = 0
+    yielded = 0
+    try:
+        while yielded < len(ranges):
+            limit = min(yielded + concurrency, len(ranges)) if ordered else len(ranges)
+            while len(active) < concurrency and started < limit:
+                start, length = ranges[started]
+                active.append(
+                    _RangeRead(container, name, started, start, allocate(start, length))
+                )
+                started += 1
+            for index in sorted(
+                poll.poll([read.pollable for read in active]), reverse=True
+            ):
+                read = active[index]
+                if read.read():
+                    del active[index]
+                    read.close()
+                    done[read.index] = read.buffer
+            if ordered:
+                while yielded in done:
+                    yield yielded, done.pop(yielded)
+                    yielded += 1
+            else:
+                for item in list(done.items()):
+                    del done[item[0]]
+                    yielded += 1
+                    yield item
+    finally:
+        for read in active:
+            read.close()
+
+
+def _ranges(size: int, range_size: int) -> list[tuple[int, int]]:
+    range_size = max(range_size, 1)
+    return [
+        (start, min(range_size, size - start)) for start in range(0, size, range_size)
+    ]
+
+
+def _container(container: Container | str) -> Container:
+    return (
+        blobstore.get_container(container) if isinstance(container, str) else container
+    )
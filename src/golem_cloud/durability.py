@@ -13,6 +13,7 @@ from wit_world.imports import durability as host_durability
 from wit_world.imports import host
 from wit_world.imports.golem_rpc_types import ValueAndType
 
+
 class Durability:
     def __init__(
         self,
@@ -61,6 +62,46 @@ class Durability:
 
         return (oplog_entry.response, oplog_entry.entry_version)
 
+    def persist_serialized(self, input: bytes, result: bytes) -> None:
+        """
+        Persists an invocation whose request and response are already serialized, instead of
+        being described as typed values.
+        """
+        if not isinstance(
+            self.durable_execution_state.persistence_level,
+            host.PersistenceLevel_PersistNothing,
+        ):
+            host_durability.persist_durable_function_invocation(
+                function_name=self._function_name(),
+                request=input,
+                response=result,
+                function_type=self.function_type,
+            )
+            host_durability.end_durable_function(
+                self.function_type, self.begin_index, self.forced_commit
+            )
+
+    def replay_serialized(self) -> tuple[bytes, host_durability.OplogEntryVersion]:
+        """
+        Replays an invocation persisted with `persist_serialized`, returning its serialized response.
+        """
+        oplog_entry = host_durability.read_persisted_durable_function_invocation()
+        validate_oplog_entry(oplog_entry, self._function_name())
+        host_durability.end_durable_function(
+            self.function_type, self.begin_index, False
+        )
+
+        return (oplog_entry.response, oplog_entry.entry_version)
+
+    def end(self) -> None:
+        """
+        Ends the durable function without persisting an invocation, for functions that failed before
+        producing a result to persist.
+        """
+        host_durability.end_durable_function(
+            self.function_type, self.begin_index, False
+        )
+
     def _function_name(self) -> str:
         if self.interface == "":
             # For backward compatibility - some of the recorded function names were not following the pattern
@@ -70,7 +111,8 @@ class Durability:
 
 
 def validate_oplog_entry(
-    oplog_entry: host_durability.PersistedTypedDurableFunctionInvocation,
+    oplog_entry: host_durability.PersistedTypedDurableFunctionInvocation
+    | host_durability.PersistedDurableFunctionInvocation,
     expected_function_name: str,
 ) -> None:
     if oplog_entry.function_name != expected_function_name:
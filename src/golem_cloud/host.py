@@ -5,6 +5,7 @@ Requires the following imports in the wit to work:
 * import golem:api/host@1.1.7;
 """
 
+from typing import Any, Callable
 from wit_world.imports.host import (
     mark_begin_operation,
     mark_end_operation,
@@ -17,62 +18,70 @@ from wit_world.imports.host import (
     get_oplog_persistence_level,
     set_oplog_persistence_level,
 )
-from contextlib import contextmanager
 
+# The context managers are classes instead of generator based context managers, as `wit_world.types.Err`
+# is a frozen exception, which contextlib fails to raise through a generator.
 
-@contextmanager
-def atomic_operation_context():
+
+class _AtomicOperation:
+    def __enter__(self) -> None:
+        self.begin_index = mark_begin_operation()
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        if exc_type is None:
+            mark_end_operation(self.begin_index)
+
+
+class _OverrideSetting:
+    def __init__(
+        self, get: Callable[[], Any], set: Callable[[Any], None], value: Any
+    ) -> None:
+        self.get = get
+        self.set = set
+        self.value = value
+
+    def __enter__(self) -> None:
+        self.original = self.get()
+        self.set(self.value)
+
+    def __exit__(self, *args: object) -> None:
+        self.set(self.original)
+
+
+def atomic_operation_context() -> _AtomicOperation:
     """
     Marks a block as an atomic operation
 
     When the context is exited, the operation gets committed.
     If the context exits with an error, the whole operation will be re-executed during retry
     """
-    begin_index = mark_begin_operation()
-    yield
-    mark_end_operation(begin_index)
+    return _AtomicOperation()
 
 
-@contextmanager
-def use_retry_policy(policy: RetryPolicy):
+def use_retry_policy(policy: RetryPolicy) -> _OverrideSetting:
     """
     Temporarily sets the retry policy to the given value.
 
     When the context is exited, the original retry policy is restored
     """
-    original = get_retry_policy()
-    set_retry_policy(policy)
-    try:
-        yield
-    finally:
-        set_retry_policy(original)
+    return _OverrideSetting(get_retry_policy, set_retry_policy, policy)
 
 
-@contextmanager
-def use_idempotence_mode(value: bool):
+def use_idempotence_mode(value: bool) -> _OverrideSetting:
     """
     Temporarily sets the idempotence mode to the given value.
 
     When the context is exited, the original idempotence mode is restored.
     """
-    original = get_idempotence_mode()
-    set_idempotence_mode(value)
-    try:
-        yield
-    finally:
-        set_idempotence_mode(original)
+    return _OverrideSetting(get_idempotence_mode, set_idempotence_mode, value)
 
 
-@contextmanager
-def use_persistence_level(value: PersistenceLevel):
+def use_persistence_level(value: PersistenceLevel) -> _OverrideSetting:
     """
     Temporarily sets the oplog persistence level to the given value.
 
     When the context is exited, the original persistence level is restored.
     """
-    original = get_oplog_persistence_level()
-    set_oplog_persistence_level(value)
-    try:
-        yield
-    finally:
-        set_oplog_persistence_level(original)
+    return _OverrideSetting(
+        get_oplog_persistence_level, set_oplog_persistence_level, value
+    )
@@ -0,0 +1,6 @@
+"""
+Helpers for the golem:rdbms interfaces.
+
+The submodules `golem_cloud.rdbms.postgres` and `golem_cloud.rdbms.mysql` each require only the import of
+their own database interface in the wit.
+"""
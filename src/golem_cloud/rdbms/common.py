@@ -0,0 +1,751 @@
+"""
+Conversions shared by the rdbms modules.
+
+Requires the imports of either golem:rdbms/postgres@0.0.1 or golem:rdbms/mysql@0.0.1 in the wit to work.
+"""
+
+import array
+import dataclasses
+import ipaddress
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from operator import call, itemgetter
+from typing import Any, Callable, Iterable, Iterator, Mapping, Self, Sequence
+from types import ModuleType
+from uuid import UUID
+from wit_world.imports import golem_rdbms_types
+
+type Converter = Callable[[Any], Any]
+
+
+def nullable(null_type: type, convert: Converter | None = None) -> Converter:
+    """
+    Returns a converter from a database value to a Python value, converting the null variant to None and
+    the payload of every other variant with `convert` (or returning it as is).
+    """
+    if convert is None:
+
+        def convert_value(value: Any) -> Any:
+            return None if value.__class__ is null_type else value.value
+
+    else:
+
+        def convert_value(value: Any) -> Any:
+            return None if value.__class__ is null_type else convert(value.value)
+
+    return convert_value
+
+
+class RowMapper[T]:
+    """
+    Maps database rows to tuples or to dataclass instances, using one converter per column.
+
+    The converters are selected once, based on the column types of the result set, so mapping a row
+    does not need to inspect the type of its values. Dataclass fields are matched to columns by name.
+    """
+
+    def __init__(
+        self, names: list[str], converters: list[Converter], cls: type[T] | None = None
+    ) -> None:
+        self.names = names
+        self.cls = cls
+        if cls is None:
+
+            def map_row(row: Any) -> Any:
+                return tuple(map(call, converters, row.values))
+
+        else:
+            indices = _field_indices(names, cls)
+            selected = [converters[index] for index in indices]
+            select = _selector(indices)
+
+            def map_row(row: Any) -> Any:
+                return cls(*map(call, selected, select(row.values)))
+
+        self.map_row: Callable[[Any], T] = map_row
+
+    def map_rows(self, rows: list[Any]) -> list[T]:
+        return list(map(self.map_row, rows))
+
+
+def map_tuples[T](
+    names: list[str], rows: list[tuple[Any, ...]], cls: type[T]
+) -> list[T]:
+    """
+    Converts rows of already converted values to instances of a dataclass, matching fields to columns by name.
+    """
+    select = _selector(_field_indices(names, cls))
+    return [cls(*select(row)) for row in rows]
+
+
+def _field_indices(names: list[str], cls: type) -> list[int]:
+    if not dataclasses.is_dataclass(cls):
+        raise TypeError(f"{cls.__qualname__} is not a dataclass")
+    fields = [field.name for field in dataclasses.fields(cls) if field.init]
+    missing = [field for field in fields if field not in names]
+    if missing:
+        raise ValueError(
+            f"Result set has no columns for fields {missing} of {cls.__qualname__}"
+        )
+    return [names.index(field) for field in fields]
+
+
+def _selector(indices: list[int]) -> Callable[[Sequence[Any]], tuple[Any, ...]]:
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda values: (values[index],)
+    return itemgetter(*indices)
+
+
+def durable_rows(
+    interface: str,
+    errors: ModuleType,
+    statement: str,
+    run: Callable[[], tuple[list[str], list[tuple[Any, ...]]]],
+) -> tuple[list[str], list[tuple[Any, ...]]]:
+    """
+    Runs a query returning column names and converted rows as a durable function. The live result (or the
+    database error) is persisted encoded with `golem_cloud.codec`, and read back from the oplog on replay.
+    The query itself is executed without persisting the host's own oplog entries.
+
+    The result is decoded from its encoding both when live and when replayed, so that it is the same in
+    both cases. Other exceptions than database errors, like the `TypeError` of values which can not be
+    encoded, are not persisted: the durable function is ended and the exception raised.
+    """
+    from wit_world.imports.host import PersistenceLevel_PersistNothing
+    from wit_world.imports.oplog import WrappedFunctionType_ReadRemote
+    from wit_world.types import Err
+    from .. import codec
+    from ..durability import Durability
+    from ..host import use_persistence_level
+
+    durability = Durability(interface, "query", WrappedFunctionType_ReadRemote())
+    if durability.is_live():
+        try:
+            with use_persistence_level(PersistenceLevel_PersistNothing()):
+                try:
+                    outcome: tuple[bool, Any] = (True, run())
+                except Err as e:
+                    outcome = (False, (type(e.value).__name__, e.value.value))
+            response = codec.encode(outcome)
+        except BaseException:
+            durability.end()
+            raise
+        durability.persist_serialized(codec.encode(statement), response)
+    else:
+        response, _ = durability.replay_serialized()
+    ok, value = codec.decode(response)
+    if not ok:
+        error_type, message = value
+        raise Err(getattr(errors, error_type)(message))
+    names, rows = value
+    return names, rows
+
+
+class Cursor[T]:
+    """
+    Iterates lazily over the rows of a result stream, fetching one page of rows from the host at a time.
+
+    The stream is released as soon as all rows have been read. Use the cursor as a context manager (or call
+    `close`) to release it when the iteration is stopped early.
+    """
+
+    def __init__(
+        self, stream: Any, mapper_factory: Callable[[list[Any]], RowMapper[T]]
+    ) -> None:
+        self._stream = stream
+        try:
+            self.columns: list[Any] = stream.get_columns()
+            self.mapper = mapper_factory(self.columns)
+        except BaseException:
+            self.close()
+            raise
+        self._rows: Iterator[T] = iter(())
+
+    def __iter__(self) -> Self:
+        return self
+
+    def __next__(self) -> T:
+        while True:
+            row = next(self._rows, None)
+            if row is not None:
+                return row
+            if self._stream is None:
+                raise StopIteration
+            page = self._stream.get_next()
+            if page is None:
+                self.close()
+                raise StopIteration
+            self._rows = map(self.mapper.map_row, page)
+
+    def close(self) -> None:
+        """
+        Releases the result stream and stops the iteration.
+        """
+        self._rows = iter(())
+        if self._stream is not None:
+            stream = self._stream
+            self._stream = None
+            stream.__exit__(None, None, None)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+
+class DictionaryColumn:
+    """
+    A column of strings, stored as the list of its distinct values and the index of each row's value in it.
+
+    Null rows are marked in `nulls`, and read as None. Their code is 0, which is not a valid index of
+    `values` if all the rows are null.
+    """
+
+    def __init__(
+        self, codes: array.array, values: list[str], nulls: bytearray | None = None
+    ) -> None:
+        self.codes = codes
+        self.values = values
+        self.nulls = nulls
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> str | None:
+        if self.nulls is not None and self.nulls[index]:
+            return None
+        return self.values[self.codes[index]]
+
+    def to_list(self) -> list[str | None]:
+        values = self.values
+        if self.nulls is None:
+            return list(map(values.__getitem__, self.codes))
+        return [
+            None if null else values[code] for code, null in zip(self.codes, self.nulls)
+        ]
+
+
+type Column = array.array | DictionaryColumn | list[Any]
+
+
+@dataclasses.dataclass
+class ColumnarResult:
+    """
+    The result of a query stored column by column.
+
+    Numeric columns are stored in `array.array`s and string columns as `DictionaryColumn`s. Values of
+    other types are stored in lists, converted the same way as by the row mappers, with None for nulls.
+    For array and dictionary columns containing nulls, `nulls` holds a mask with 1 for the null rows.
+    The stored value of null rows in arrays is 0, while dictionary columns return None for them.
+    """
+
+    names: list[str]
+    columns: list[Column]
+    nulls: list[bytearray | None]
+    length: int
+
+    def __len__(self) -> int:
+        return self.length
+
+    def column(self, name: str) -> Column:
+        return self.columns[self.names.index(name)]
+
+    def null_mask(self, name: str) -> bytearray | None:
+        return self.nulls[self.names.index(name)]
+
+
+class ColumnBuilder:
+    """
+    Collects the values of one column of a result set, page by page.
+    """
+
+    def __init__(self, null_type: type) -> None:
+        self.null_type = null_type
+        self.nulls: bytearray | None = None
+        self.length = 0
+
+    def extend(self, values: Sequence[Any]) -> None:
+        try:
+            self._extend([value.value for value in values])
+        except AttributeError:
+            # the null variant has no payload
+            if self.nulls is None:
+                self.nulls = bytearray(self.length)
+            null_type = self.null_type
+            self.nulls.extend(value.__class__ is null_type for value in values)
+            self._extend(
+                [
+                    None if value.__class__ is null_type else value.value
+                    for value in values
+                ]
+            )
+        else:
+            if self.nulls is not None:
+                self.nulls.extend(bytes(len(values)))
+        self.length += len(values)
+
+    def _extend(self, payloads: list[Any]) -> None:
+        raise NotImplementedError
+
+    def finish(self) -> Column:
+        raise NotImplementedError
+
+
+class ArrayColumnBuilder(ColumnBuilder):
+    def __init__(self, null_type: type, typecode: str) -> None:
+        super().__init__(null_type)
+        self.data = array.array(typecode)
+
+    def _extend(self, payloads: list[Any]) -> None:
+        if self.nulls is not None:
+            payloads = [0 if payload is None else payload for payload in payloads]
+        self.data.extend(payloads)
+
+    def finish(self) -> Column:
+        return self.data
+
+
+class DictionaryColumnBuilder(ColumnBuilder):
+    def __init__(self, null_type: type, label: Converter | None = None) -> None:
+        super().__init__(null_type)
+        self.label = label
+        self.codes = array.array("I")
+        self.index: dict[str, int] = {}
+
+    def _extend(self, payloads: list[Any]) -> None:
+        if self.label is not None:
+            label = self.label
+            payloads = [
+                None if payload is None else label(payload) for payload in payloads
+            ]
+        index = self.index
+        add = index.setdefault
+        self.codes.extend(
+            [0 if payload is None else add(payload, len(index)) for payload in payloads]
+        )
+
+    def finish(self) -> Column:
+        return DictionaryColumn(self.codes, list(self.index), self.nulls)
+
+
+class ListColumnBuilder(ColumnBuilder):
+    def __init__(self, null_type: type, convert: Converter) -> None:
+        super().__init__(null_type)
+        self.convert = convert
+        self.data: list[Any] = []
+
+    def extend(self, values: Sequence[Any]) -> None:
+        self.data.extend(map(self.convert, values))
+        self.length += len(values)
+
+    def finish(self) -> Column:
+        return self.data
+
+
+def fetch_columns(
+    stream: Any, builder_factory: Callable[[Any], ColumnBuilder]
+) -> ColumnarResult:
+    """
+    Reads all the rows of a result stream into a `ColumnarResult`, releasing the stream afterwards.
+    """
+    with stream:
+        columns = stream.get_columns()
+        builders = [builder_factory(column) for column in columns]
+        length = 0
+        while (page := stream.get_next()) is not None:
+            if not page:
+                continue
+            for builder, values in zip(builders, zip(*[row.values for row in page])):
+                builder.extend(values)
+            length += len(page)
+    return ColumnarResult(
+        [column.name for column in columns],
+        [builder.finish() for builder in builders],
+        [builder.nulls for builder in builders],
+        length,
+    )
+
+
+class ValueEncoder:
+    """
+    Converts Python values to database values. The conversion is selected once per Python type, based on
+    the conversions registered for the type or for one of its base classes.
+    """
+
+    def __init__(self, encoders: dict[type, Converter]) -> None:
+        self._registered = dict(encoders)
+        self._encoders = dict(encoders)
+
+    def __call__(self, value: Any) -> Any:
+        encode = self._encoders.get(type(value))
+        if encode is None:
+            encode = self.encoder(type(value))
+        return encode(value)
+
+    def encoder(self, cls: type) -> Converter:
+        """
+        Returns the conversion used for values of the given type.
+        """
+        encode = self._encoders.get(cls)
+        if encode is None:
+            for base in cls.__mro__[1:]:
+                if base in self._registered:
+                    encode = self._registered[base]
+                    break
+            else:
+                raise TypeError(
+                    f"Cannot convert value of type {cls.__qualname__} to a database value"
+                )
+            self._encoders[cls] = encode
+        return encode
+
+    def register(self, cls: type, encode: Converter) -> None:
+        """
+        Registers the conversion of values of the given type (and of its subclasses without their own conversion).
+        """
+        self._registered[cls] = encode
+        self._encoders = dict(self._registered)
+
+
+def insert_statements(
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    max_params: int,
+    placeholder: Callable[[int], str],
+    encode: ValueEncoder,
+) -> Iterator[tuple[str, list[Any]]]:
+    """
+    Splits rows into multi-row insert statements with at most `max_params` parameters each, yielding the
+    statements with their encoded parameters. `placeholder` returns the placeholder of the n-th (1-based) parameter.
+    """
+    width = len(columns)
+    if width == 0:
+        raise ValueError("At least one column is required")
+    rows_per_statement = max_params // width
+    if rows_per_statement == 0:
+        raise ValueError(f"Rows of {width} columns exceed {max_params} parameters")
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    statements: dict[int, str] = {}
+
+    def statement(count: int) -> str:
+        result = statements.get(count)
+        if result is None:
+            result = prefix + ", ".join(
+                "("
+                + ", ".join(
+                    placeholder(row * width + column + 1) for column in range(width)
+                )
+                + ")"
+                for row in range(count)
+            )
+            statements[count] = result
+        return result
+
+    params: list[Any] = []
+    count = 0
+    for row in rows:
+        if len(row) != width:
+            raise ValueError(f"Expected {width} values in row, got {len(row)}")
+        params.extend(map(encode, row))
+        count += 1
+        if count == rows_per_statement:
+            yield statement(count), params
+            params = []
+            count = 0
+    if count:
+        yield statement(count), params
+
+
+POSTGRES_STATEMENT_TOKENS = re.compile(
+    r"""
+    (?<!\w)[Ee]'(?:[^'\\]|\\.|'')*'             # escape string literal
+    | '(?:[^']|'')*'                            # string literal
+    | "(?:[^"]|"")*"                            # quoted identifier
+    | --[^\n]*                                  # line comment
+    | /\*.*?\*/                                 # block comment
+    | \$(?P<tag>[A-Za-z_]\w*|)\$.*?\$(?P=tag)\$ # dollar quoted string
+    | ::                                        # cast
+    | :(?P<name>[A-Za-z_]\w*)                   # named parameter
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+"""
+Matches the named parameters of postgres statements, and the tokens in which names are not parameters.
+"""
+
+MYSQL_STATEMENT_TOKENS = re.compile(
+    r"""
+    '(?:[^'\\]|\\.|'')*'                        # string literal, with backslash escapes
+    | "(?:[^"\\]|\\.|"")*"                      # string literal, with backslash escapes
+    | `[^`]*`                                   # quoted identifier
+    | (?:--\s|\#)[^\n]*                         # line comment
+    | /\*.*?\*/                                 # block comment
+    | :(?P<name>[A-Za-z_]\w*)                   # named parameter
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+"""
+Matches the named parameters of mysql statements, and the tokens in which names are not parameters.
+"""
+
+
+class NamedParameters:
+    """
+    Rewrites a statement with named `:name` parameters to use positional placeholders, and converts
+    mappings of parameter values to the positional parameter lists of the rewritten statement.
+
+    `tokens` matches the named parameters, and the literals, identifiers and comments of the SQL dialect
+    in which names are not replaced, like `POSTGRES_STATEMENT_TOKENS` and `MYSQL_STATEMENT_TOKENS`.
+
+    `placeholder` returns the placeholder of the n-th (1-based) parameter. If `reuse_placeholders` is set,
+    all occurrences of a name share one placeholder, otherwise each occurrence gets its own.
+    """
+
+    def __init__(
+        self,
+        statement: str,
+        tokens: re.Pattern[str],
+        placeholder: Callable[[int], str],
+        reuse_placeholders: bool,
+        encode: ValueEncoder,
+    ) -> None:
+        names: list[str] = []
+
+        def replace(match: re.Match[str]) -> str:
+            name = match.group("name")
+            if name is None:
+                return match.group(0)
+            if reuse_placeholders and name in names:
+                return placeholder(names.index(name) + 1)
+            names.append(name)
+            return placeholder(len(names))
+
+        self.statement = tokens.sub(replace, statement)
+        self.names = tuple(names)
+        self._encode = encode
+
+    def encode(self, params: Mapping[str, Any]) -> list[Any]:
+        """
+        Returns the converted values of the parameters in the order of their placeholders.
+        """
+        encode = self._encode
+        try:
+            return [encode(params[name]) for name in self.names]
+        except KeyError as e:
+            raise ValueError(f"Missing value of parameter {e.args[0]}") from None
+
+
+def run_in_transaction[R](
+    connection: Any, transaction_type: type, run: Callable[[Any], R]
+) -> R:
+    """
+    Runs `run` with the given transaction, or if a connection was given, with a new transaction that is
+    committed when `run` succeeds and rolled back when it raises.
+    """
+    if isinstance(connection, transaction_type):
+        return run(connection)
+    with connection.begin_transaction() as transaction:
+        try:
+            result = run(transaction)
+        except BaseException:
+            transaction.rollback()
+            raise
+        transaction.commit()
+        return result
+
+
+class Transaction:
+    """
+    A database transaction used as a context manager, committed when the block succeeds and rolled back
+    when it raises.
+
+    Rows added with `insert` are queued and written with multi-row insert statements when the queued rows
+    reach `max_params` parameters, before any other statement of the transaction is executed, and before
+    committing. If `atomic` is set, the transaction is also an atomic region of the oplog, which gets
+    re-executed as a whole if the worker is interrupted before the commit.
+    """
+
+    def __init__(
+        self,
+        connection: Any,
+        atomic: bool,
+        max_params: int,
+        placeholder: Callable[[int], str],
+        encode: ValueEncoder,
+        mapper_factory: Callable[[list[Any], type | None], RowMapper[Any]],
+    ) -> None:
+        self.connection = connection
+        self.atomic = atomic
+        self.max_params = max_params
+        self._placeholder = placeholder
+        self._encode = encode
+        self._mapper_factory = mapper_factory
+        self._pending: list[tuple[str, tuple[str, ...], list[Sequence[Any]]]] = []
+        self._pending_params = 0
+        self._begin_index: int | None = None
+        self.transaction: Any = None
+
+    def __enter__(self) -> Self:
+        if self.atomic:
+            from wit_world.imports.host import mark_begin_operation
+
+            self._begin_index = mark_begin_operation()
+        self.transaction = self.connection.begin_transaction()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        transaction = self.transaction
+        try:
+            if exc_type is None:
+                self.flush()
+                transaction.commit()
+            else:
+                self._pending = []
+                self._pending_params = 0
+                transaction.rollback()
+        finally:
+            self.transaction = None
+            transaction.__exit__(None, None, None)
+        if exc_type is None and self._begin_index is not None:
+            from wit_world.imports.host import mark_end_operation
+
+            mark_end_operation(self._begin_index)
+
+    def execute(self, statement: str, params: Sequence[Any] = ()) -> int:
+        """
+        Executes a statement with parameters given as Python or database values, after the queued inserts.
+        """
+        self.flush()
+        return self.transaction.execute(statement, list(map(self._encode, params)))
+
+    def query[T](
+        self, statement: str, params: Sequence[Any] = (), cls: type[T] | None = None
+    ) -> list[T]:
+        """
+        Executes a query after the queued inserts, returning its rows as tuples or as instances of the given dataclass.
+        """
+        self.flush()
+        result = self.transaction.query(statement, list(map(self._encode, params)))
+        return self._mapper_factory(result.columns, cls).map_rows(result.rows)
+
+    def insert(self, table: str, columns: Sequence[str], row: Sequence[Any]) -> None:
+        """
+        Queues a row of Python or database values to be inserted into a table.
+        """
+        columns = tuple(columns)
+        if self._pending and self._pending[-1][:2] == (table, columns):
+            rows = self._pending[-1][2]
+        else:
+            rows = []
+            self._pending.append((table, columns, rows))
+        rows.append(row)
+        self._pending_params += len(columns)
+        if self._pending_params + len(columns) > self.max_params:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Writes the queued rows, returning the number of inserted rows.
+        """
+        inserted = 0
+        pending = self._pending
+        self._pending = []
+        self._pending_params = 0
+        for table, columns, rows in pending:
+            for statement, params in insert_statements(
+                table, columns, rows, self.max_params, self._placeholder, self._encode
+            ):
+                inserted += self.transaction.execute(statement, params)
+        return inserted
+
+
+def to_date(value: golem_rdbms_types.Date) -> date:
+    return date(value.year, value.month, value.day)
+
+
+def to_time(value: golem_rdbms_types.Time) -> time:
+    return time(value.hour, value.minute, value.second, value.nanosecond // 1000)
+
+
+def to_datetime(value: golem_rdbms_types.Timestamp) -> datetime:
+    d = value.date
+    t = value.time
+    return datetime(
+        d.year, d.month, d.day, t.hour, t.minute, t.second, t.nanosecond // 1000
+    )
+
+
+def to_timezone(offset: int) -> timezone:
+    return timezone(timedelta(seconds=offset))
+
+
+def to_datetime_tz(value: golem_rdbms_types.Timestamptz) -> datetime:
+    return to_datetime(value.timestamp).replace(tzinfo=to_timezone(value.offset))
+
+
+def to_time_tz(value: golem_rdbms_types.Timetz) -> time:
+    return to_time(value.time).replace(tzinfo=to_timezone(value.offset))
+
+
+def to_uuid(value: golem_rdbms_types.Uuid) -> UUID:
+    return UUID(int=(value.high_bits << 64) | value.low_bits)
+
+
+def to_ip_address(
+    value: golem_rdbms_types.IpAddress,
+) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+    if isinstance(value, golem_rdbms_types.IpAddress_Ipv4):
+        return ipaddress.IPv4Address(bytes(value.value))
+    address = 0
+    for segment in value.value:
+        address = (address << 16) | segment
+    return ipaddress.IPv6Address(address)
+
+
+def to_mac_address(value: golem_rdbms_types.MacAddress) -> str:
+    return ":".join(f"{octet:02x}" for octet in value.octets)
+
+
+def from_date(value: date) -> golem_rdbms_types.Date:
+    return golem_rdbms_types.Date(value.year, value.month, value.day)
+
+
+def from_time(value: time | datetime) -> golem_rdbms_types.Time:
+    return golem_rdbms_types.Time(
+        value.hour, value.minute, value.second, value.microsecond * 1000
+    )
+
+
+def from_datetime(value: datetime) -> golem_rdbms_types.Timestamp:
+    return golem_rdbms_types.Timestamp(from_date(value), from_time(value))
+
+
+def _offset(value: time | datetime) -> int:
+    offset = value.utcoffset()
+    return 0 if offset is None else int(offset.total_seconds())
+
+
+def from_datetime_tz(value: datetime) -> golem_rdbms_types.Timestamptz:
+    return golem_rdbms_types.Timestamptz(from_datetime(value), _offset(value))
+
+
+def from_time_tz(value: time) -> golem_rdbms_types.Timetz:
+    return golem_rdbms_types.Timetz(from_time(value), _offset(value))
+
+
+def from_uuid(value: UUID) -> golem_rdbms_types.Uuid:
+    return golem_rdbms_types.Uuid(value.int >> 64, value.int & 0xFFFFFFFFFFFFFFFF)
+
+
+def from_ip_address(
+    value: ipaddress.IPv4Address | ipaddress.IPv6Address,
+) -> golem_rdbms_types.IpAddress:
+    if isinstance(value, ipaddress.IPv4Address):
+        return golem_rdbms_types.IpAddress_Ipv4(tuple(value.packed))
+    address = int(value)
+    return golem_rdbms_types.IpAddress_Ipv6(
+        tuple((address >> shift) & 0xFFFF for shift in range(112, -1, -16))
+    )
@@ -0,0 +1,339 @@
+"""
+Typed access to mysql databases.
+
+Requires the following imports in the wit to work:
+* import golem:rdbms/mysql@0.0.1;
+
+`durable_query` additionally requires the imports of `golem_cloud.durability`, and atomic transactions
+require the import of golem:api/host@1.1.7.
+"""
+
+import functools
+import typing
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Iterable, Mapping, Sequence
+from wit_world.imports import mysql as host_mysql
+from .common import (
+    ColumnarResult,
+    Converter,
+    Cursor,
+    RowMapper,
+    ValueEncoder,
+    nullable,
+)
+from . import common
+
+type Connection = host_mysql.DbConnection | host_mysql.DbTransaction
+
+_INTERFACE = "golem:rdbms/mysql"
+
+MAX_PARAMS = 65535
+"""
+The maximum number of parameters of a single statement.
+"""
+
+_CONVERTERS: dict[type, Converter | None] = {
+    host_mysql.DbColumnType_Decimal: Decimal,
+    host_mysql.DbColumnType_Date: common.to_date,
+    host_mysql.DbColumnType_Datetime: common.to_datetime,
+    host_mysql.DbColumnType_Timestamp: common.to_datetime,
+    host_mysql.DbColumnType_Time: common.to_time,
+}
+
+
+def column_converter(db_type: host_mysql.DbColumnType) -> Converter:
+    """
+    Returns the function converting the values of a column of the given type to Python values.
+
+    Decimal values are converted to `Decimal` and date and time values to `datetime` values. Values of
+    other types are returned as they are.
+    """
+    return nullable(host_mysql.DbValue_Null, _CONVERTERS.get(type(db_type)))
+
+
+to_db_value = ValueEncoder(
+    {
+        type(None): lambda value: host_mysql.DbValue_Null(),
+        bool: host_mysql.DbValue_Boolean,
+        int: host_mysql.DbValue_Bigint,
+        float: host_mysql.DbValue_Double,
+        str: host_mysql.DbValue_Varchar,
+        bytes: host_mysql.DbValue_Varbinary,
+        bytearray: lambda value: host_mysql.DbValue_Varbinary(bytes(value)),
+        Decimal: lambda value: host_mysql.DbValue_Decimal(str(value)),
+        datetime: lambda value: host_mysql.DbValue_Datetime(
+            common.from_datetime(value)
+        ),
+        date: lambda value: host_mysql.DbValue_Date(common.from_date(value)),
+        time: lambda value: host_mysql.DbValue_Time(common.from_time(value)),
+    }
+    | {cls: lambda value: value for cls in typing.get_args(host_mysql.DbValue)}
+)
+"""
+Converts a Python value to a mysql value. Database values are passed through as they are; the mapping
+of other types can be changed with `to_db_value.register`.
+"""
+
+
+_TYPECODES: dict[type, str] = {
+    host_mysql.DbColumnType_Boolean: "b",
+    host_mysql.DbColumnType_Tinyint: "b",
+    host_mysql.DbColumnType_Smallint: "h",
+    host_mysql.DbColumnType_Mediumint: "i",
+    host_mysql.DbColumnType_Int: "i",
+    host_mysql.DbColumnType_Bigint: "q",
+    host_mysql.DbColumnType_TinyintUnsigned: "B",
+    host_mysql.DbColumnType_SmallintUnsigned: "H",
+    host_mysql.DbColumnType_MediumintUnsigned: "I",
+    host_mysql.DbColumnType_IntUnsigned: "I",
+    host_mysql.DbColumnType_BigintUnsigned: "Q",
+    host_mysql.DbColumnType_Float: "f",
+    host_mysql.DbColumnType_Double: "d",
+    host_mysql.DbColumnType_Year: "H",
+}
+
+_STRING_TYPES = {
+    host_mysql.DbColumnType_Fixchar,
+    host_mysql.DbColumnType_Varchar,
+    host_mysql.DbColumnType_Tinytext,
+    host_mysql.DbColumnType_Text,
+    host_mysql.DbColumnType_Mediumtext,
+    host_mysql.DbColumnType_Longtext,
+    host_mysql.DbColumnType_Enumeration,
+    host_mysql.DbColumnType_Set,
+}
+
+
+def _column_builder(column: host_mysql.DbColumn) -> common.ColumnBuilder:
+    db_type = type(column.db_type)
+    if db_type in _TYPECODES:
+        return common.ArrayColumnBuilder(host_mysql.DbValue_Null, _TYPECODES[db_type])
+    if db_type in _STRING_TYPES:
+        return common.DictionaryColumnBuilder(host_mysql.DbValue_Null)
+    return common.ListColumnBuilder(
+        host_mysql.DbValue_Null, column_converter(column.db_type)
+    )
+
+
+def row_mapper[T](
+    columns: list[host_mysql.DbColumn], cls: type[T] | None = None
+) -> RowMapper[T]:
+    """
+    Creates a mapper converting rows with the given columns to tuples, or to instances of the given dataclass.
+    """
+    return RowMapper(
+        [column.name for column in columns],
+        [column_converter(column.db_type) for column in columns],
+        cls,
+    )
+
+
+def query[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_mysql.DbValue] = (),
+    cls: type[T] | None = None,
+) -> list[T]:
+    """
+    Executes a query and returns its rows as tuples, or as instances of the given dataclass.
+
+    Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+    """
+    result = connection.query(statement, list(params))
+    return row_mapper(result.columns, cls).map_rows(result.rows)
+
+
+def query_one[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_mysql.DbValue] = (),
+    cls: type[T] | None = None,
+) -> T | None:
+    """
+    Executes a query and returns its first row, or None if it returned no rows.
+
+    Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+    """
+    result = connection.query(statement, list(params))
+    if not result.rows:
+        return None
+    return row_mapper(result.columns, cls).map_row(result.rows[0])
+
+
+def durable_query[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_mysql.DbValue] = (),
+    cls: type[T] | None = None,
+) -> list[T]:
+    """
+    Variant of `query` that persists its converted rows in the oplog, encoded with `golem_cloud.codec`,
+    and reads them back from the oplog on replay instead of executing the query again.
+
+    The rows are returned as decoded from their encoding with `golem_cloud.codec`, both when live and when
+    replayed. Additionally requires the imports of `golem_cloud.durability`.
+
+    Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+    """
+
+    def run() -> tuple[list[str], list[tuple[Any, ...]]]:
+        result = connection.query(statement, list(params))
+        mapper = row_mapper(result.columns)
+        return mapper.names, mapper.map_rows(result.rows)
+
+    names, rows = common.durable_rows(_INTERFACE, host_mysql, statement, run)
+    return rows if cls is None else common.map_tuples(names, rows, cls)
+
+
+def query_stream[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_mysql.DbValue] = (),
+    cls: type[T] | None = None,
+) -> Cursor[T]:
+    """
+    Executes a query and returns a cursor lazily yielding its rows as tuples, or as instances of the given
+    dataclass. Only one page of rows is held in memory at a time.
+
+    Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+    """
+    stream = connection.query_stream(statement, list(params))
+    return Cursor(stream, lambda columns: row_mapper(columns, cls))
+
+
+def fetch_columns(
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_mysql.DbValue] = (),
+) -> ColumnarResult:
+    """
+    Executes a query and returns its result column by column. Numeric columns are stored in `array.array`s
+    and string columns as dictionary encoded `DictionaryColumn`s, see `ColumnarResult`.
+
+    Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+    """
+    stream = connection.query_stream(statement, list(params))
+    return common.fetch_columns(stream, _column_builder)
+
+
+def insert_many(
+    connection: Connection,
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    max_params: int = MAX_PARAMS,
+) -> int:
+    """
+    Inserts rows of Python values into a table, using multi-row insert statements with at most `max_params`
+    parameters each, and returns the number of inserted rows.
+
+    If a connection is given, all the statements are executed in a new transaction, which gets rolled back
+    if any of them fails. If a transaction is given, the statements are executed as part of it.
+    The table and column names are inserted into the statements as they are.
+
+    Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+    """
+    statements = common.insert_statements(
+        table, columns, rows, max_params, lambda index: "?", to_db_value
+    )
+    return common.run_in_transaction(
+        connection,
+        host_mysql.DbTransaction,
+        lambda transaction: sum(
+            transaction.execute(statement, params) for statement, params in statements
+        ),
+    )
+
+
+def transaction(
+    connection: host_mysql.DbConnection,
+    atomic: bool = True,
+    max_params: int = MAX_PARAMS,
+) -> common.Transaction:
+    """
+    Returns a context manager running its block in a new transaction of the connection, see
+    `golem_cloud.rdbms.common.Transaction`:
+
+    ```python
+    with transaction(connection) as tx:
+        for user in users:
+            tx.insert("users", ["id", "name"], [user.id, user.name])
+    ```
+
+    Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+    """
+    return common.Transaction(
+        connection, atomic, max_params, lambda index: "?", to_db_value, row_mapper
+    )
+
+
+class Query:
+    """
+    A statement with named `:name` parameters. The statement is rewritten to positional placeholders once,
+    and every execution only converts the given parameter values, in the order of the placeholders.
+    """
+
+    def __init__(self, statement: str) -> None:
+        self._parameters = common.NamedParameters(
+            statement,
+            common.MYSQL_STATEMENT_TOKENS,
+            lambda index: "?",
+            False,
+            to_db_value,
+        )
+        self.statement = self._parameters.statement
+        self.names = self._parameters.names
+
+    def params(self, params: Mapping[str, Any]) -> list[host_mysql.DbValue]:
+        """
+        Returns the positional parameters of the statement for the given parameter values.
+        """
+        return self._parameters.encode(params)
+
+    def query[T](
+        self,
+        connection: Connection,
+        params: Mapping[str, Any] = {},
+        cls: type[T] | None = None,
+    ) -> list[T]:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+        """
+        return query(connection, self.statement, self.params(params), cls)
+
+    def query_one[T](
+        self,
+        connection: Connection,
+        params: Mapping[str, Any] = {},
+        cls: type[T] | None = None,
+    ) -> T | None:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+        """
+        return query_one(connection, self.statement, self.params(params), cls)
+
+    def query_stream[T](
+        self,
+        connection: Connection,
+        params: Mapping[str, Any] = {},
+        cls: type[T] | None = None,
+    ) -> Cursor[T]:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+        """
+        return query_stream(connection, self.statement, self.params(params), cls)
+
+    def execute(self, connection: Connection, params: Mapping[str, Any] = {}) -> int:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.mysql.Error)`
+        """
+        return connection.execute(self.statement, self.params(params))
+
+
+@functools.lru_cache(maxsize=256)
+def prepare(statement: str) -> Query:
+    """
+    Returns the `Query` of a statement with named parameters, reusing it for recently prepared statements.
+    """
+    return Query(statement)
@@ -0,0 +1,201 @@
+"""
+Reuse of database connections across requests.
+
+Does not require any imports in the wit. The pooled connections are opened with the given function, for
+example `wit_world.imports.postgres.DbConnection.open`, which requires the import of its interface.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Protocol, Self
+
+
+class PooledConnection(Protocol):
+    def query(self, statement: str, params: list[Any]) -> Any: ...
+
+    def begin_transaction(self) -> Any: ...
+
+    def __exit__(self, *args: Any) -> bool | None: ...
+
+
+def select_one(connection: PooledConnection) -> bool:
+    """
+    Checks the health of a connection by running `SELECT 1`.
+    """
+    try:
+        connection.query("SELECT 1", [])
+        return True
+    except Exception:
+        return False
+
+
+@dataclass
+class _IdleConnection[C]:
+    connection: C
+    idle_since: float
+    checked_at: float
+
+
+class ConnectionPool[C: PooledConnection]:
+    """
+    Keeps open connections, keyed by database address, to be reused by later requests of the worker.
+
+    At most `max_size` connections are kept per address. When all of them are in use, an additional
+    connection is opened and gets closed once released. Connections idle for longer than `max_idle`
+    seconds are closed, and connections idle for longer than `check_interval` seconds are checked with
+    `health_check` before being handed out. Connections released by a block that raised an exception are
+    closed instead of being reused, as their state is unknown.
+    """
+
+    def __init__(
+        self,
+        open: Callable[[str], C],
+        max_size: int = 10,
+        max_idle: float = 300.0,
+        check_interval: float = 30.0,
+        health_check: Callable[[C], bool] = select_one,
+    ) -> None:
+        self.open = open
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self.health_check = health_check
+        self._idle: dict[str, list[_IdleConnection[C]]] = {}
+        self._in_use: dict[str, int] = {}
+
+    def connection(self, address: str) -> "_Checkout[C]":
+        """
+        Checks out a connection to the given address for the duration of a `with` block.
+
+        Raises: `wit_world.types.Err` with the error of the database interface if a new connection can not be opened
+        """
+        return _Checkout(self, address)
+
+    def transaction(self, address: str) -> "_TransactionCheckout[C]":
+        """
+        Checks out a connection to the given address and runs a `with` block in a new transaction of it.
+        The transaction is committed when the block succeeds and rolled back when it raises.
+
+        Raises: `wit_world.types.Err` with the error of the database interface
+        """
+        return _TransactionCheckout(_Checkout(self, address))
+
+    def evict_idle(self) -> None:
+        """
+        Closes the connections that have been idle for longer than `max_idle` seconds.
+        """
+        now = time.monotonic()
+        for idle in self._idle.values():
+            expired = [
+                entry for entry in idle if now - entry.idle_since > self.max_idle
+            ]
+            if expired:
+                idle[:] = [
+                    entry for entry in idle if now - entry.idle_since <= self.max_idle
+                ]
+                for entry in expired:
+                    _close(entry.connection)
+
+    def close(self) -> None:
+        """
+        Closes all the idle connections.
+        """
+        idle = self._idle
+        self._idle = {}
+        for entries in idle.values():
+            for entry in entries:
+                _close(entry.connection)
+
+    def size(self, address: str) -> int:
+        """
+        The number of pooled connections to the given address, idle or in use.
+        """
+        return len(self._idle.get(address, ())) + self._in_use.get(address, 0)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def _acquire(self, address: str) -> tuple[C, bool]:
+        self.evict_idle()
+        idle = self._idle.get(address)
+        now = time.monotonic()
+        while idle:
+            entry = idle.pop()
+            if now - entry.checked_at > self.check_interval:
+                if not self.health_check(entry.connection):
+                    _close(entry.connection)
+                    continue
+            self._in_use[address] = self._in_use.get(address, 0) + 1
+            return entry.connection, True
+        connection = self.open(address)
+        if self.size(address) >= self.max_size:
+            return connection, False
+        self._in_use[address] = self._in_use.get(address, 0) + 1
+        return connection, True
+
+    def _release(self, address: str, connection: C, pooled: bool, reuse: bool) -> None:
+        if pooled:
+            self._in_use[address] -= 1
+        if pooled and reuse:
+            now = time.monotonic()
+            self._idle.setdefault(address, []).append(
+                _IdleConnection(connection, now, now)
+            )
+        else:
+            _close(connection)
+
+
+# Checkouts are not generator based context managers, as `Err` can not be raised through those
+class _Checkout[C: PooledConnection]:
+    def __init__(self, pool: ConnectionPool[C], address: str) -> None:
+        self.pool = pool
+        self.address = address
+
+    def __enter__(self) -> C:
+        self.connection, self.pooled = self.pool._acquire(self.address)
+        return self.connection
+
+    def __exit__(self, exc_type: type[BaseException] | None, *args: object) -> None:
+        self.pool._release(
+            self.address, self.connection, self.pooled, reuse=exc_type is None
+        )
+
+
+class _TransactionCheckout[C: PooledConnection]:
+    def __init__(self, checkout: _Checkout[C]) -> None:
+        self.checkout = checkout
+
+    def __enter__(self) -> Any:
+        connection = self.checkout.__enter__()
+        try:
+            self.transaction = connection.begin_transaction()
+        except BaseException as e:
+            self.checkout.__exit__(type(e), e, e.__traceback__)
+            raise
+        return self.transaction
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: object,
+    ) -> None:
+        try:
+            try:
+                if exc_type is None:
+                    self.transaction.commit()
+                else:
+                    self.transaction.rollback()
+            finally:
+                self.transaction.__exit__(None, None, None)
+        except BaseException as e:
+            self.checkout.__exit__(type(e), e, e.__traceback__)
+            raise
+        self.checkout.__exit__(exc_type, exc_value, traceback)
+
+
+def _close(connection: PooledConnection) -> None:
+    connection.__exit__(None, None, None)
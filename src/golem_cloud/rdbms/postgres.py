@@ -0,0 +1,564 @@
+"""
+Typed access to postgres databases.
+
+Requires the following imports in the wit to work:
+* import golem:rdbms/postgres@0.0.1;
+
+`durable_query` additionally requires the imports of `golem_cloud.durability`, and atomic transactions
+require the import of golem:api/host@1.1.7.
+"""
+
+import ipaddress
+import functools
+import typing
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Mapping, Sequence
+from uuid import UUID
+from wit_world.imports import postgres as host_postgres
+from .common import (
+    ColumnarResult,
+    Converter,
+    Cursor,
+    RowMapper,
+    ValueEncoder,
+    nullable,
+)
+from . import common
+
+type Connection = host_postgres.DbConnection | host_postgres.DbTransaction
+
+_INTERFACE = "golem:rdbms/postgres"
+
+MAX_PARAMS = 65535
+"""
+The maximum number of parameters of a single statement.
+"""
+
+DEFAULT_COLUMN_BATCH_SIZE = 100_000
+"""
+The default number of rows inserted by one statement of `insert_columns`.
+"""
+
+_CONVERTERS: dict[type, Converter | None] = {
+    host_postgres.DbColumnType_Character: None,
+    host_postgres.DbColumnType_Int2: None,
+    host_postgres.DbColumnType_Int4: None,
+    host_postgres.DbColumnType_Int8: None,
+    host_postgres.DbColumnType_Float4: None,
+    host_postgres.DbColumnType_Float8: None,
+    host_postgres.DbColumnType_Numeric: Decimal,
+    host_postgres.DbColumnType_Boolean: None,
+    host_postgres.DbColumnType_Text: None,
+    host_postgres.DbColumnType_Varchar: None,
+    host_postgres.DbColumnType_Bpchar: None,
+    host_postgres.DbColumnType_Timestamp: common.to_datetime,
+    host_postgres.DbColumnType_Timestamptz: common.to_datetime_tz,
+    host_postgres.DbColumnType_Date: common.to_date,
+    host_postgres.DbColumnType_Time: common.to_time,
+    host_postgres.DbColumnType_Timetz: common.to_time_tz,
+    host_postgres.DbColumnType_Bytea: None,
+    host_postgres.DbColumnType_Uuid: common.to_uuid,
+    host_postgres.DbColumnType_Xml: None,
+    host_postgres.DbColumnType_Json: None,
+    host_postgres.DbColumnType_Jsonb: None,
+    host_postgres.DbColumnType_Jsonpath: None,
+    host_postgres.DbColumnType_Inet: common.to_ip_address,
+    host_postgres.DbColumnType_Cidr: common.to_ip_address,
+    host_postgres.DbColumnType_Macaddr: common.to_mac_address,
+    host_postgres.DbColumnType_Money: None,
+    host_postgres.DbColumnType_Oid: None,
+    host_postgres.DbColumnType_Enumeration: lambda value: value.value,
+}
+
+
+def column_converter(db_type: host_postgres.DbColumnType) -> Converter:
+    """
+    Returns the function converting the values of a column of the given type to Python values.
+
+    Numeric values are converted to `Decimal`, date and time values to `datetime` values, uuids to `UUID`,
+    network addresses to `ipaddress` addresses and enumerations to their labels. Arrays are converted to
+    lists and composites to tuples of converted values, domains to the converted value of their base type.
+    Values of other types (intervals, bit strings and ranges) are returned as they are.
+    """
+    if isinstance(db_type, host_postgres.DbColumnType_Array):
+        element = column_converter(db_type.value.get())
+        return nullable(
+            host_postgres.DbValue_Null,
+            lambda values: [element(value.get()) for value in values],
+        )
+    if isinstance(db_type, host_postgres.DbColumnType_Composite):
+        attributes = [
+            column_converter(attribute.get())
+            for _, attribute in db_type.value.attributes
+        ]
+        return nullable(
+            host_postgres.DbValue_Null,
+            lambda composite: tuple(
+                convert(value.get())
+                for convert, value in zip(attributes, composite.values)
+            ),
+        )
+    if isinstance(db_type, host_postgres.DbColumnType_Domain):
+        base = column_converter(db_type.value.base_type.get())
+        return nullable(
+            host_postgres.DbValue_Null, lambda domain: base(domain.value.get())
+        )
+    return nullable(host_postgres.DbValue_Null, _CONVERTERS.get(type(db_type)))
+
+
+def _encode_list(values: list[Any]) -> host_postgres.DbValue:
+    return host_postgres.DbValue_Array(
+        [host_postgres.LazyDbValue(to_db_value(value)) for value in values]
+    )
+
+
+to_db_value = ValueEncoder(
+    {
+        type(None): lambda value: host_postgres.DbValue_Null(),
+        bool: host_postgres.DbValue_Boolean,
+        int: host_postgres.DbValue_Int8,
+        float: host_postgres.DbValue_Float8,
+        str: host_postgres.DbValue_Text,
+        bytes: host_postgres.DbValue_Bytea,
+        bytearray: lambda value: host_postgres.DbValue_Bytea(bytes(value)),
+        Decimal: lambda value: host_postgres.DbValue_Numeric(str(value)),
+        datetime: lambda value: (
+            host_postgres.DbValue_Timestamp(common.from_datetime(value))
+            if value.tzinfo is None
+            else host_postgres.DbValue_Timestamptz(common.from_datetime_tz(value))
+        ),
+        date: lambda value: host_postgres.DbValue_Date(common.from_date(value)),
+        time: lambda value: (
+            host_postgres.DbValue_Time(common.from_time(value))
+            if value.tzinfo is None
+            else host_postgres.DbValue_Timetz(common.from_time_tz(value))
+        ),
+        UUID: lambda value: host_postgres.DbValue_Uuid(common.from_uuid(value)),
+        ipaddress.IPv4Address: lambda value: host_postgres.DbValue_Inet(
+            common.from_ip_address(value)
+        ),
+        ipaddress.IPv6Address: lambda value: host_postgres.DbValue_Inet(
+            common.from_ip_address(value)
+        ),
+        list: _encode_list,
+        tuple: _encode_list,
+    }
+    | {cls: lambda value: value for cls in typing.get_args(host_postgres.DbValue)}
+)
+"""
+Converts a Python value to a postgres value. Database values are passed through as they are; the mapping
+of other types can be changed with `to_db_value.register`.
+"""
+
+
+_TYPECODES: dict[type, str] = {
+    host_postgres.DbColumnType_Character: "b",
+    host_postgres.DbColumnType_Int2: "h",
+    host_postgres.DbColumnType_Int4: "i",
+    host_postgres.DbColumnType_Int8: "q",
+    host_postgres.DbColumnType_Float4: "f",
+    host_postgres.DbColumnType_Float8: "d",
+    host_postgres.DbColumnType_Boolean: "b",
+    host_postgres.DbColumnType_Money: "q",
+    host_postgres.DbColumnType_Oid: "I",
+}
+
+_STRING_TYPES = {
+    host_postgres.DbColumnType_Text,
+    host_postgres.DbColumnType_Varchar,
+    host_postgres.DbColumnType_Bpchar,
+}
+
+
+def _column_builder(column: host_postgres.DbColumn) -> common.ColumnBuilder:
+    db_type = type(column.db_type)
+    if db_type in _TYPECODES:
+        return common.ArrayColumnBuilder(
+            host_postgres.DbValue_Null, _TYPECODES[db_type]
+        )
+    if db_type in _STRING_TYPES:
+        return common.DictionaryColumnBuilder(host_postgres.DbValue_Null)
+    if db_type is host_postgres.DbColumnType_Enumeration:
+        return common.DictionaryColumnBuilder(
+            host_postgres.DbValue_Null, lambda value: value.value
+        )
+    return common.ListColumnBuilder(
+        host_postgres.DbValue_Null, column_converter(column.db_type)
+    )
+
+
+def row_mapper[T](
+    columns: list[host_postgres.DbColumn], cls: type[T] | None = None
+) -> RowMapper[T]:
+    """
+    Creates a mapper converting rows with the given columns to tuples, or to instances of the given dataclass.
+    """
+    return RowMapper(
+        [column.name for column in columns],
+        [column_converter(column.db_type) for column in columns],
+        cls,
+    )
+
+
+def query[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_postgres.DbValue] = (),
+    cls: type[T] | None = None,
+) -> list[T]:
+    """
+    Executes a query and returns its rows as tuples, or as instances of the given dataclass.
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+    result = connection.query(statement, list(params))
+    return row_mapper(result.columns, cls).map_rows(result.rows)
+
+
+def query_one[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_postgres.DbValue] = (),
+    cls: type[T] | None = None,
+) -> T | None:
+    """
+    Executes a query and returns its first row, or None if it returned no rows.
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+    result = connection.query(statement, list(params))
+    if not result.rows:
+        return None
+    return row_mapper(result.columns, cls).map_row(result.rows[0])
+
+
+_RANGE_TYPES = (
+    host_postgres.DbColumnType_Int4range,
+    host_postgres.DbColumnType_Int8range,
+    host_postgres.DbColumnType_Numrange,
+    host_postgres.DbColumnType_Tsrange,
+    host_postgres.DbColumnType_Tstzrange,
+    host_postgres.DbColumnType_Daterange,
+    host_postgres.DbColumnType_Range,
+)
+
+
+def _replayable(db_type: host_postgres.DbColumnType) -> bool:
+    # whether the converted values of a column type are decoded as they were encoded by the codec
+    if isinstance(db_type, host_postgres.DbColumnType_Array):
+        return _replayable(db_type.value.get())
+    if isinstance(db_type, host_postgres.DbColumnType_Composite):
+        return all(
+            _replayable(attribute.get()) for _, attribute in db_type.value.attributes
+        )
+    if isinstance(db_type, host_postgres.DbColumnType_Domain):
+        return _replayable(db_type.value.base_type.get())
+    return not isinstance(db_type, _RANGE_TYPES)
+
+
+def durable_query[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_postgres.DbValue] = (),
+    cls: type[T] | None = None,
+) -> list[T]:
+    """
+    Variant of `query` that persists its converted rows in the oplog, encoded with `golem_cloud.codec`,
+    and reads them back from the oplog on replay instead of executing the query again.
+
+    The rows are returned as decoded from their encoding, both when live and when replayed: values that
+    are dataclasses, like intervals, are returned as dicts of their fields. Range columns are rejected with
+    a `TypeError`, as the kinds of their bounds can not be told apart once encoded. Additionally requires
+    the imports of `golem_cloud.durability`.
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+
+    def run() -> tuple[list[str], list[tuple[Any, ...]]]:
+        result = connection.query(statement, list(params))
+        for column in result.columns:
+            if not _replayable(column.db_type):
+                raise TypeError(
+                    f"Column {column.name} of type {column.db_type_name} is not supported by durable_query"
+                )
+        mapper = row_mapper(result.columns)
+        return mapper.names, mapper.map_rows(result.rows)
+
+    names, rows = common.durable_rows(_INTERFACE, host_postgres, statement, run)
+    return rows if cls is None else common.map_tuples(names, rows, cls)
+
+
+def query_stream[T](
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_postgres.DbValue] = (),
+    cls: type[T] | None = None,
+) -> Cursor[T]:
+    """
+    Executes a query and returns a cursor lazily yielding its rows as tuples, or as instances of the given
+    dataclass. Only one page of rows is held in memory at a time.
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+    stream = connection.query_stream(statement, list(params))
+    return Cursor(stream, lambda columns: row_mapper(columns, cls))
+
+
+def fetch_columns(
+    connection: Connection,
+    statement: str,
+    params: Sequence[host_postgres.DbValue] = (),
+) -> ColumnarResult:
+    """
+    Executes a query and returns its result column by column. Numeric columns are stored in `array.array`s
+    and string columns as dictionary encoded `DictionaryColumn`s, see `ColumnarResult`.
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+    stream = connection.query_stream(statement, list(params))
+    return common.fetch_columns(stream, _column_builder)
+
+
+def insert_many(
+    connection: Connection,
+    table: str,
+    columns: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    max_params: int = MAX_PARAMS,
+) -> int:
+    """
+    Inserts rows of Python values into a table, using multi-row insert statements with at most `max_params`
+    parameters each, and returns the number of inserted rows.
+
+    If a connection is given, all the statements are executed in a new transaction, which gets rolled back
+    if any of them fails. If a transaction is given, the statements are executed as part of it.
+    The table and column names are inserted into the statements as they are.
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+    statements = common.insert_statements(
+        table, columns, rows, max_params, lambda index: f"${index}", to_db_value
+    )
+    return common.run_in_transaction(
+        connection,
+        host_postgres.DbTransaction,
+        lambda transaction: sum(
+            transaction.execute(statement, params) for statement, params in statements
+        ),
+    )
+
+
+def insert_columns(
+    connection: Connection,
+    table: str,
+    columns: Mapping[str, Sequence[Any]],
+    types: Mapping[str, str] | None = None,
+    batch_size: int = DEFAULT_COLUMN_BATCH_SIZE,
+) -> int:
+    """
+    Inserts column-oriented data into a table and returns the number of inserted rows.
+
+    Every column is passed as a single array parameter of an `INSERT ... SELECT * FROM unnest(...)`
+    statement, so one statement inserts up to `batch_size` rows. `types` optionally maps column names to
+    their SQL type, used to cast the array parameters (for example `{"id": "int8"}`).
+
+    Columns of None, bool, int, float, `Decimal`, str, bytes, date and time, `UUID` and `ipaddress` values
+    are passed as the text of a postgres array literal, cast to an array of the column type (given in
+    `types`, or inferred from the Python type of the values). Other columns, and columns mixing values that
+    map to different SQL types, are passed as `DbValue_Array`s. Every element of those is a `LazyDbValue`
+    resource, which takes a host call to create, so they are considerably slower to insert.
+
+    If a connection is given, all the statements are executed in a new transaction, which gets rolled back
+    if any of them fails. If a transaction is given, the statements are executed as part of it.
+    The table and column names are inserted into the statements as they are.
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+    if not columns:
+        raise ValueError("At least one column is required")
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) != 1:
+        raise ValueError("All columns must have the same number of values")
+    (length,) = lengths
+    types = types or {}
+    text_types = {
+        name: _text_array_type(values, types.get(name))
+        for name, values in columns.items()
+    }
+    arrays = []
+    for index, name in enumerate(columns, 1):
+        text_type = text_types[name]
+        if text_type is not None:
+            arrays.append(f"${index}::text::{text_type}[]")
+        elif name in types:
+            arrays.append(f"${index}::{types[name]}[]")
+        else:
+            arrays.append(f"${index}")
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) SELECT * FROM unnest({', '.join(arrays)})"
+
+    def insert(transaction: host_postgres.DbTransaction) -> int:
+        inserted = 0
+        for start in range(0, length, batch_size):
+            params: list[host_postgres.DbValue] = [
+                host_postgres.DbValue_Text(
+                    _text_array(values[start : start + batch_size])
+                )
+                if text_types[name] is not None
+                else _encode_list(values[start : start + batch_size])
+                for name, values in columns.items()
+            ]
+            inserted += transaction.execute(statement, params)
+        return inserted
+
+    return common.run_in_transaction(connection, host_postgres.DbTransaction, insert)
+
+
+_TEXT_ARRAY_TYPES: dict[type, Callable[[Any], str]] = {
+    bool: lambda value: "bool",
+    int: lambda value: "int8",
+    float: lambda value: "float8",
+    Decimal: lambda value: "numeric",
+    str: lambda value: "text",
+    bytes: lambda value: "bytea",
+    bytearray: lambda value: "bytea",
+    date: lambda value: "date",
+    datetime: lambda value: "timestamp" if value.tzinfo is None else "timestamptz",
+    time: lambda value: "time" if value.tzinfo is None else "timetz",
+    UUID: lambda value: "uuid",
+    ipaddress.IPv4Address: lambda value: "inet",
+    ipaddress.IPv6Address: lambda value: "inet",
+}
+
+
+def _text_array_type(values: Sequence[Any], sql_type: str | None) -> str | None:
+    # the element type to cast a column written as an array literal to, None if it can not be written as one
+    inferred = set()
+    for value in values:
+        if value is not None:
+            infer = _TEXT_ARRAY_TYPES.get(type(value))
+            if infer is None:
+                return None
+            if sql_type is None:
+                inferred.add(infer(value))
+    if sql_type is not None:
+        return sql_type
+    if len(inferred) > 1:
+        return None
+    return inferred.pop() if inferred else "text"
+
+
+def _text_array(values: Sequence[Any]) -> str:
+    return "{" + ",".join(map(_array_element, values)) + "}"
+
+
+def _array_element(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if value is True or value is False:
+        return "t" if value else "f"
+    if isinstance(value, (bytes, bytearray)):
+        text = "\\x" + value.hex()
+    elif isinstance(value, (date, time)):
+        text = value.isoformat()
+    else:
+        text = str(value)
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def transaction(
+    connection: host_postgres.DbConnection,
+    atomic: bool = True,
+    max_params: int = MAX_PARAMS,
+) -> common.Transaction:
+    """
+    Returns a context manager running its block in a new transaction of the connection, see
+    `golem_cloud.rdbms.common.Transaction`:
+
+    ```python
+    with transaction(connection) as tx:
+        for user in users:
+            tx.insert("users", ["id", "name"], [user.id, user.name])
+    ```
+
+    Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+    """
+    return common.Transaction(
+        connection,
+        atomic,
+        max_params,
+        lambda index: f"${index}",
+        to_db_value,
+        row_mapper,
+    )
+
+
+class Query:
+    """
+    A statement with named `:name` parameters. The statement is rewritten to positional placeholders once,
+    and every execution only converts the given parameter values, in the order of the placeholders.
+    """
+
+    def __init__(self, statement: str) -> None:
+        self._parameters = common.NamedParameters(
+            statement,
+            common.POSTGRES_STATEMENT_TOKENS,
+            lambda index: f"${index}",
+            True,
+            to_db_value,
+        )
+        self.statement = self._parameters.statement
+        self.names = self._parameters.names
+
+    def params(self, params: Mapping[str, Any]) -> list[host_postgres.DbValue]:
+        """
+        Returns the positional parameters of the statement for the given parameter values.
+        """
+        return self._parameters.encode(params)
+
+    def query[T](
+        self,
+        connection: Connection,
+        params: Mapping[str, Any] = {},
+        cls: type[T] | None = None,
+    ) -> list[T]:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+        """
+        return query(connection, self.statement, self.params(params), cls)
+
+    def query_one[T](
+        self,
+        connection: Connection,
+        params: Mapping[str, Any] = {},
+        cls: type[T] | None = None,
+    ) -> T | None:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+        """
+        return query_one(connection, self.statement, self.params(params), cls)
+
+    def query_stream[T](
+        self,
+        connection: Connection,
+        params: Mapping[str, Any] = {},
+        cls: type[T] | None = None,
+    ) -> Cursor[T]:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+        """
+        return query_stream(connection, self.statement, self.params(params), cls)
+
+    def execute(self, connection: Connection, params: Mapping[str, Any] = {}) -> int:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.postgres.Error)`
+        """
+        return connection.execute(self.statement, self.params(params))
+
+
+@functools.lru_cache(maxsize=256)
+def prepare(statement: str) -> Query:
+    """
+    Returns the `Query` of a statement with named parameters, reusing it for recently prepared statements.
+    """
+    return Query(statement)
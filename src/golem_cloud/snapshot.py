@@ -0,0 +1,465 @@
+"""
+Tools for implementing snapshot-based worker updates.
+
+The state of the worker is split into named regions which are encoded independently. Snapshots can
+either be full, or deltas containing only the regions that changed since a base snapshot. Every full
+snapshot gets a random id, which deltas refer to, so a delta is only applied on top of its own base.
+
+Snapshots are written as a stream of independently compressed chunks, and regions are encoded one at a
+time, so saving only holds the encoding of a single region in memory at once. Regions can opt in to
+caching their encoding between snapshots, trading the memory of the cached encoding for not encoding
+unchanged regions again.
+
+Regions are versioned. When a snapshot created by an older version of the component is loaded, the
+registered migration functions are applied to bring the state up to date.
+
+Does not require any imports in the wit. To be used when implementing the following exports:
+* export golem:api/save-snapshot@1.1.7;
+* export golem:api/load-snapshot@1.1.7;
+"""
+
+import io
+import struct
+import zlib
+from typing import Any, Callable, Iterator, Protocol, Self
+from uuid import UUID, uuid4
+from wit_world.types import Err
+from . import codec
+
+_MAGIC = b"GSNP"
+_FORMAT_VERSION = 4
+
+_KIND_FULL = 0
+_KIND_DELTA = 1
+
+_HEADER = struct.Struct("<4sBBQ16s16s")
+_CHUNK_HEADER = struct.Struct("<II")
+_REGION_HEADER = struct.Struct("<HIQ")
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_COMPRESSION_LEVEL = 1
+
+
+class SnapshotSink(Protocol):
+    """
+    Destination of a streamed snapshot, for example an `io.BytesIO` or an open file.
+    """
+
+    def write(self, data: bytes, /) -> object: ...
+
+
+class SnapshotRegion[T]:
+    """
+    A named part of the worker state that is encoded independently of the other regions.
+
+    After mutating the value in place call `mark_dirty`, so the next snapshot picks up the change.
+
+    With `cache_encoded`, the encoded form of the region is kept between snapshots and reused as long as
+    the region is not marked dirty. This avoids encoding large, rarely changing regions on every snapshot,
+    at the cost of keeping their encoding in memory next to their value.
+
+    `migrations` maps a version to a function upgrading the decoded value of that version to the next
+    version. `restore` converts the decoded (and migrated) value to the value of the region.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        value: T,
+        encode: Callable[[T], bytes],
+        decode: Callable[[bytes], Any],
+        version: int = 1,
+        migrations: dict[int, Callable[[Any], Any]] | None = None,
+        restore: Callable[[Any], T] | None = None,
+        cache_encoded: bool = False,
+    ) -> None:
+        self.name = name
+        self.value = value
+        self.version = version
+        self.migrations = migrations or {}
+        self.cache_encoded = cache_encoded
+        self._encode = encode
+        self._decode = decode
+        self._restore = restore
+        self._encoded: bytes | None = None
+        self._changed_since_base = True
+
+    def get(self) -> T:
+        return self.value
+
+    def set(self, value: T) -> None:
+        self.value = value
+        self.mark_dirty()
+
+    def mark_dirty(self) -> None:
+        self._encoded = None
+        self._changed_since_base = True
+
+    def is_dirty(self) -> bool:
+        """
+        Whether the region gets encoded again by the next snapshot, which is always the case for regions
+        without `cache_encoded`.
+        """
+        return self._encoded is None
+
+    def _encoded_value(self) -> bytes:
+        if self._encoded is not None:
+            return self._encoded
+        encoded = self._encode(self.value)
+        if self.cache_encoded:
+            self._encoded = encoded
+        return encoded
+
+    def _load(self, data: bytes, version: int, full: bool) -> None:
+        if version > self.version:
+            raise Err(
+                f"Snapshot region {self.name} has version {version}, but only versions up to {self.version} are supported"
+            )
+        value = self._decode(data)
+        for from_version in range(version, self.version):
+            migration = self.migrations.get(from_version)
+            if migration is None:
+                raise Err(
+                    f"No migration for snapshot region {self.name} from version {from_version}"
+                )
+            value = migration(value)
+        self.value = value if self._restore is None else self._restore(value)
+
+        migrated = version != self.version
+        self._encoded = data if self.cache_encoded and not migrated else None
+        # regions loaded from a delta still differ from the base, so they have to be part of the next delta
+        self._changed_since_base = migrated or not full
+
+
+class Snapshot:
+    """
+    A collection of snapshot regions making up the state of a worker.
+
+    `save` and `load` can be used directly to implement the `save-snapshot` and `load-snapshot` exports.
+    `save_delta` produces a snapshot containing only the regions changed since the last full snapshot,
+    which can be combined with its base using `merge`.
+
+    `generation` counts the snapshots, while `snapshot_id` is the id of the last full snapshot saved or
+    loaded, which deltas are checked against.
+    """
+
+    def __init__(self) -> None:
+        self.regions: dict[str, SnapshotRegion] = {}
+        self.generation = 0
+        self.snapshot_id: UUID | None = None
+
+    def region[T](
+        self,
+        name: str,
+        value: T,
+        encode: Callable[[T], bytes],
+        decode: Callable[[bytes], Any],
+        version: int = 1,
+        migrations: dict[int, Callable[[Any], Any]] | None = None,
+        cache_encoded: bool = False,
+    ) -> SnapshotRegion[T]:
+        """
+        Registers a new region with its initial value, using custom encoding.
+        """
+        return self._add(
+            SnapshotRegion(
+                name,
+                value,
+                encode,
+                decode,
+                version,
+                migrations,
+                cache_encoded=cache_encoded,
+            )
+        )
+
+    def register[T](
+        self,
+        name: str,
+        value: T,
+        version: int = 1,
+        migrations: dict[int, Callable[[Any], Any]] | None = None,
+        cls: Any = None,
+        cache_encoded: bool = False,
+    ) -> SnapshotRegion[T]:
+        """
+        Registers a new region with its initial value, encoded with `golem_cloud.codec`.
+
+        Migrations receive the decoded value of the older version, with dataclasses represented as dicts
+        of their fields. The result is converted to `cls` (the type of the initial value by default), so
+        annotated generic types like `dict[str, Account]` can be used to restore nested dataclasses.
+        """
+        target = type(value) if cls is None else cls
+        return self._add(
+            SnapshotRegion(
+                name,
+                value,
+                codec.encode,
+                codec.decode,
+                version,
+                migrations,
+                lambda raw: codec.convert(raw, target),
+                cache_encoded,
+            )
+        )
+
+    def _add[T](self, region: SnapshotRegion[T]) -> SnapshotRegion[T]:
+        if region.name in self.regions:
+            raise ValueError(f"Snapshot region {region.name} is already registered")
+        self.regions[region.name] = region
+        return region
+
+    def save(self) -> bytes:
+        """
+        Creates a full snapshot of all the regions. The snapshot becomes the base of subsequent deltas.
+
+        The compressed snapshot is built in memory; use `save_into` to stream it into a file instead.
+        """
+        sink = io.BytesIO()
+        self.save_into(sink)
+        # hands over the buffer of the BytesIO instead of copying it, as it is not used afterwards
+        return sink.getvalue()
+
+    def save_into(self, sink: SnapshotSink) -> None:
+        """
+        Streams a full snapshot of all the regions into the given sink.
+        """
+        self.generation += 1
+        self.snapshot_id = uuid4()
+        with SnapshotWriter(
+            sink, self.generation, snapshot_id=self.snapshot_id
+        ) as writer:
+            for name, region in self.regions.items():
+                writer.write_region(name, region._encoded_value(), region.version)
+        for region in self.regions.values():
+            region._changed_since_base = False
+
+    def save_delta(self) -> bytes:
+        """
+        Creates a snapshot containing only the regions that changed since the last full snapshot
+        was taken or loaded.
+        """
+        sink = io.BytesIO()
+        self.save_delta_into(sink)
+        return sink.getvalue()
+
+    def save_delta_into(self, sink: SnapshotSink) -> None:
+        """
+        Streams a snapshot containing only the changed regions into the given sink.
+        """
+        if self.snapshot_id is None:
+            raise ValueError(
+                "A full snapshot has to be saved or loaded before saving a delta"
+            )
+        with SnapshotWriter(sink, self.generation + 1, self.snapshot_id) as writer:
+            for name, region in self.regions.items():
+                if region._changed_since_base:
+                    writer.write_region(name, region._encoded_value(), region.version)
+
+    def load(self, data: bytes) -> None:
+        """
+        Loads a full snapshot, or applies a delta on top of the currently loaded base snapshot.
+
+        Raises `Err` with a description of the problem if the snapshot cannot be loaded.
+        """
+        reader = SnapshotReader(data)
+        if reader.base is not None and reader.base != self.snapshot_id:
+            raise Err(
+                f"Snapshot delta is based on snapshot {reader.base}, but the current snapshot is {self.snapshot_id}"
+            )
+        for name, version, encoded in reader.regions():
+            region = self.regions.get(name)
+            if region is None:
+                raise Err(f"Snapshot contains unknown region {name}")
+            region._load(encoded, version, reader.base is None)
+        if reader.base is None:
+            self.generation = reader.generation
+            self.snapshot_id = reader.snapshot_id
+
+
+class SnapshotWriter:
+    """
+    Writes a snapshot into a sink as a sequence of compressed chunks.
+
+    Region data is fed to the compressor through memoryview slices, so at most one uncompressed chunk
+    is buffered besides the data of the region being written. Must be closed (or used as a context manager) to write the final chunk.
+    Passing the id of a base snapshot as `base` makes the written snapshot a delta. The id of the written
+    snapshot is `snapshot_id`, or a new random id if not given.
+    """
+
+    def __init__(
+        self,
+        sink: SnapshotSink,
+        generation: int,
+        base: UUID | None = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        compression_level: int = DEFAULT_COMPRESSION_LEVEL,
+        snapshot_id: UUID | None = None,
+    ) -> None:
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.compression_level = compression_level
+        self.snapshot_id = uuid4() if snapshot_id is None else snapshot_id
+        self._buffer = bytearray()
+        kind = _KIND_FULL if base is None else _KIND_DELTA
+        sink.write(
+            _HEADER.pack(
+                _MAGIC,
+                _FORMAT_VERSION,
+                kind,
+                generation,
+                self.snapshot_id.bytes,
+                bytes(16) if base is None else base.bytes,
+            )
+        )
+
+    def write_region(self, name: str, data: bytes, version: int = 1) -> None:
+        encoded_name = name.encode()
+        self._write(_REGION_HEADER.pack(len(encoded_name), version, len(data)))
+        self._write(encoded_name)
+        self._write(data)
+
+    def close(self) -> None:
+        if self._buffer:
+            self._write_chunk(self._buffer)
+            self._buffer.clear()
+        self.sink.write(_CHUNK_HEADER.pack(0, 0))
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+
+    def _write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            if not self._buffer and len(view) >= self.chunk_size:
+                self._write_chunk(view[: self.chunk_size])
+                view = view[self.chunk_size :]
+            else:
+                length = min(len(view), self.chunk_size - len(self._buffer))
+                self._buffer += view[:length]
+                view = view[length:]
+                if len(self._buffer) == self.chunk_size:
+                    self._write_chunk(self._buffer)
+                    self._buffer.clear()
+
+    def _write_chunk(self, chunk: bytes) -> None:
+        compressed = zlib.compress(chunk, self.compression_level)
+        self.sink.write(_CHUNK_HEADER.pack(len(chunk), len(compressed)))
+        self.sink.write(compressed)
+
+
+class SnapshotReader:
+    """
+    Reads a snapshot written by `SnapshotWriter`, decompressing it one chunk at a time.
+    """
+
+    def __init__(self, data: bytes) -> None:
+        if len(data) < _HEADER.size:
+            raise Err("Snapshot is truncated")
+        magic, version, kind, generation, snapshot_id, base = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise Err("Not a golem-cloud snapshot")
+        if version != _FORMAT_VERSION:
+            raise Err(f"Unsupported snapshot format version {version}")
+        self.generation = generation
+        self.snapshot_id = UUID(bytes=snapshot_id)
+        self.base = UUID(bytes=base) if kind == _KIND_DELTA else None
+        self._data = memoryview(data)
+
+    def regions(self) -> Iterator[tuple[str, int, bytes]]:
+        """
+        Yields the name, version and encoded data of each region in the snapshot.
+        """
+        chunks = _ChunkInput(self._chunks())
+        while (header := chunks.read(_REGION_HEADER.size)) is not None:
+            name_length, version, data_length = _REGION_HEADER.unpack(header)
+            name = chunks.read(name_length)
+            data = chunks.read(data_length)
+            if name is None or data is None:
+                raise Err("Snapshot is truncated")
+            yield (name.decode(), version, data)
+
+    def _chunks(self) -> Iterator[memoryview]:
+        offset = _HEADER.size
+        while True:
+            if offset + _CHUNK_HEADER.size > len(self._data):
+                raise Err("Snapshot is truncated")
+            length, compressed_length = _CHUNK_HEADER.unpack_from(self._data, offset)
+            offset += _CHUNK_HEADER.size
+            if length == 0:
+                return
+            end = offset + compressed_length
+            if end > len(self._data):
+                raise Err("Snapshot is truncated")
+            try:
+                chunk = zlib.decompress(self._data[offset:end], bufsize=length)
+            except zlib.error as e:
+                raise Err(f"Snapshot is corrupted: {e}")
+            if len(chunk) != length:
+                raise Err("Snapshot is corrupted: unexpected chunk length")
+            yield memoryview(chunk)
+            offset = end
+
+
+class _ChunkInput:
+    def __init__(self, chunks: Iterator[memoryview]) -> None:
+        self._chunks = chunks
+        self._current = memoryview(b"")
+
+    def read(self, length: int) -> bytearray | None:
+        """
+        Reads exactly `length` bytes, or returns None if the input ended before any byte was read.
+        """
+        result = bytearray(length)
+        target = memoryview(result)
+        position = 0
+        while position < length:
+            if not self._current:
+                next_chunk = next(self._chunks, None)
+                if next_chunk is None:
+                    if position == 0:
+                        return None
+                    raise Err("Snapshot is truncated")
+                self._current = next_chunk
+            count = min(length - position, len(self._current))
+            target[position : position + count] = self._current[:count]
+            self._current = self._current[count:]
+            position += count
+        return result
+
+
+def merge(base: bytes, *deltas: bytes) -> bytes:
+    """
+    Reassembles a full snapshot from a base snapshot and the deltas taken on top of it.
+
+    The deltas must be given in the order they were created. The merged snapshot keeps the id of the base,
+    as deltas contain all the changes since their base, so later deltas of the same base can still be
+    applied to it.
+    """
+    base_reader = SnapshotReader(base)
+    if base_reader.base is not None:
+        raise Err("The base of a snapshot merge must be a full snapshot")
+    merged = {name: (version, data) for name, version, data in base_reader.regions()}
+    generation = base_reader.generation
+    for delta in deltas:
+        reader = SnapshotReader(delta)
+        if reader.base != base_reader.snapshot_id:
+            raise Err(
+                f"Snapshot delta is not based on snapshot {base_reader.snapshot_id}"
+            )
+        merged.update(
+            (name, (version, data)) for name, version, data in reader.regions()
+        )
+        generation = reader.generation
+
+    sink = io.BytesIO()
+    with SnapshotWriter(
+        sink, generation, snapshot_id=base_reader.snapshot_id
+    ) as writer:
+        for name, (version, data) in merged.items():
+            writer.write_region(name, data, version)
+    return sink.getvalue()
@@ -0,0 +1,133 @@
+"""
+Chunked reading and writing of wasi:io streams.
+
+Requires the following imports in the wit to work:
+* import wasi:io/poll@0.2.3;
+* import wasi:io/streams@0.2.3;
+"""
+
+from typing import Iterator
+from wit_world.types import Err
+from wit_world.imports.streams import InputStream, OutputStream, StreamError_Closed
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def write_all(
+    stream: OutputStream,
+    data: bytes | bytearray | memoryview,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> None:
+    """
+    Writes all the data to the stream in chunks of at most `chunk_size` bytes, never exceeding the number
+    of bytes permitted by `check_write` and waiting for the stream to become writable when needed.
+
+    Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+    """
+    view = memoryview(data).cast("B")
+    position = 0
+    while position < len(view):
+        permitted = stream.check_write()
+        if permitted == 0:
+            with stream.subscribe() as pollable:
+                pollable.block()
+            continue
+        end = min(position + permitted, position + chunk_size, len(view))
+        stream.write(bytes(view[position:end]))
+        position = end
+
+
+def read_chunk(stream: InputStream, size: int) -> bytes | None:
+    """
+    Reads at most `size` bytes from the stream, waiting until at least one byte is available.
+    Returns None when the stream is closed.
+
+    Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)` if the stream failed
+    """
+    try:
+        while True:
+            chunk = stream.blocking_read(size)
+            if chunk:
+                return chunk
+    except Err as e:
+        if isinstance(e.value, StreamError_Closed):
+            return None
+        raise
+
+
+def read_into(stream: InputStream, buffer: bytearray | memoryview) -> int:
+    """
+    Reads from the stream into the buffer until the buffer is full or the stream is closed, and returns
+    the number of bytes read.
+
+    Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)` if the stream failed
+    """
+    view = memoryview(buffer).cast("B")
+    position = 0
+    while position < len(view):
+        chunk = read_chunk(stream, len(view) - position)
+        if chunk is None:
+            break
+        view[position : position + len(chunk)] = chunk
+        position += len(chunk)
+    return position
+
+
+def iter_chunks(
+    stream: InputStream, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    Yields the contents of the stream in chunks of at most `chunk_size` bytes, until the stream is closed.
+
+    Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)` if the stream failed
+    """
+    while (chunk := read_chunk(stream, chunk_size)) is not None:
+        yield chunk
+
+
+class ChunkedWriter:
+    """
+    Writes to a stream in chunks of `chunk_size` bytes, buffering the data that does not fill a whole chunk.
+
+    At most `chunk_size` bytes are buffered, whatever the size of the writes: a write first fills up the
+    buffered chunk, then its whole chunks are written to the stream directly, and only its remainder is
+    buffered.
+    """
+
+    def __init__(
+        self, stream: OutputStream, chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> None:
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def write(self, data: bytes | bytearray | memoryview) -> int:
+        """
+        Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+        """
+        view = memoryview(data).cast("B")
+        length = len(view)
+        if self._buffer:
+            count = min(self.chunk_size - len(self._buffer), len(view))
+            self._buffer += view[:count]
+            view = view[count:]
+            if len(self._buffer) < self.chunk_size:
+                return length
+            write_all(self.stream, self._buffer, self.chunk_size)
+            self._buffer.clear()
+        whole = len(view) - len(view) % self.chunk_size
+        if whole:
+            write_all(self.stream, view[:whole], self.chunk_size)
+        self._buffer += view[whole:]
+        return length
+
+    def flush(self) -> None:
+        """
+        Writes the buffered data to the stream and waits until the stream has written all of it.
+
+        Raises: `wit_world.types.Err(wit_world.imports.streams.StreamError)`
+        """
+        if self._buffer:
+            write_all(self.stream, self._buffer, self.chunk_size)
+            self._buffer.clear()
+        self.stream.blocking_flush()
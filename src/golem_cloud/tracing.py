@@ -0,0 +1,138 @@
+"""
+Tracing and timing of transaction operations.
+
+Requires the following imports in the wit to work:
+* import golem:api/context@1.1.7;
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+from wit_world import types
+from wit_world.types import Ok
+from wit_world.imports import context
+
+
+@dataclass
+class OperationStats:
+    """
+    Aggregated timing of one phase (`execute` or `compensate`) of an operation.
+    """
+
+    operation: str
+    phase: str
+    count: int = 0
+    failures: int = 0
+    total_ns: int = 0
+    max_ns: int = 0
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.count if self.count else 0.0
+
+
+class TransactionTracer:
+    """
+    Measures every action and compensating action executed by the transactions it is passed to.
+
+    Each execution is reported as a span of the invocation context, with the operation name, phase, attempt,
+    outcome and duration as attributes. Spans can be disabled with `spans=False`, in which case only the
+    in-memory statistics returned by `summary` are collected. Compensating actions returning a
+    `PendingCompensation` are measured until they get started.
+    """
+
+    def __init__(self, spans: bool = True) -> None:
+        self.spans = spans
+        self.stats: dict[tuple[str, str], OperationStats] = {}
+
+    def trace[R](
+        self, phase: str, operation: str, run: Callable[[], R], attempt: int = 1
+    ) -> R:
+        span = context.start_span(f"{phase} {operation}") if self.spans else None
+        start = time.perf_counter_ns()
+        outcome = "exception"
+        try:
+            result = run()
+            outcome = _outcome(result)
+            return result
+        finally:
+            duration = time.perf_counter_ns() - start
+            self._record(phase, operation, outcome, duration)
+            if span is not None:
+                with span:
+                    _set_attributes(span, phase, operation, attempt, outcome, duration)
+
+    async def trace_async[R](
+        self,
+        phase: str,
+        operation: str,
+        run: Callable[[], Awaitable[R]],
+        attempt: int = 1,
+    ) -> R:
+        span = context.start_span(f"{phase} {operation}") if self.spans else None
+        start = time.perf_counter_ns()
+        outcome = "exception"
+        try:
+            result = await run()
+            outcome = _outcome(result)
+            return result
+        finally:
+            duration = time.perf_counter_ns() - start
+            self._record(phase, operation, outcome, duration)
+            if span is not None:
+                with span:
+                    _set_attributes(span, phase, operation, attempt, outcome, duration)
+
+    def summary(self) -> list[OperationStats]:
+        """
+        Returns the collected statistics, the operations with the highest total duration first.
+        """
+        return sorted(
+            self.stats.values(), key=lambda stats: stats.total_ns, reverse=True
+        )
+
+    def reset(self) -> None:
+        self.stats.clear()
+
+    def _record(self, phase: str, operation: str, outcome: str, duration: int) -> None:
+        stats = self.stats.get((operation, phase))
+        if stats is None:
+            stats = OperationStats(operation, phase)
+            self.stats[(operation, phase)] = stats
+        stats.count += 1
+        stats.total_ns += duration
+        if duration > stats.max_ns:
+            stats.max_ns = duration
+        if outcome != "ok" and outcome != "pending":
+            stats.failures += 1
+
+
+def _outcome(result: object) -> str:
+    if isinstance(result, Ok):
+        return "ok"
+    elif isinstance(result, types.Err):
+        return "error"
+    else:
+        return "pending"
+
+
+def _set_attributes(
+    span: context.Span,
+    phase: str,
+    operation: str,
+    attempt: int,
+    outcome: str,
+    duration: int,
+) -> None:
+    span.set_attributes(
+        [
+            context.Attribute(key, context.AttributeValue_String(value))
+            for key, value in (
+                ("operation", operation),
+                ("phase", phase),
+                ("attempt", str(attempt)),
+                ("outcome", outcome),
+                ("duration_ns", str(duration)),
+            )
+        ]
+    )
@@ -3,14 +3,58 @@ Tools to perform transactional operations using compensating actions.
 
 Requires the following imports in the wit to work:
 * import golem:api/host@1.1.7;
+
+Compensating actions returning a `PendingCompensation` additionally require:
+* import wasi:io/poll@0.2.3;
+
+Durable infallible transactions additionally require the imports of `golem_cloud.durability`,
+and tracing requires the imports of `golem_cloud.tracing`.
 """
 
+import asyncio
+import random
+import time
 from dataclasses import dataclass
 from wit_world import types
 from wit_world.types import Result, Ok
-from wit_world.imports.host import set_oplog_index, get_oplog_index
-from typing import Callable
-from .host import atomic_operation_context
+from wit_world.imports.host import (
+    set_oplog_index,
+    get_oplog_index,
+    PersistenceLevel_PersistNothing,
+    RetryPolicy,
+)
+from typing import Any, Awaitable, Callable, Iterator, Protocol, TYPE_CHECKING
+from .host import atomic_operation_context, use_persistence_level, use_retry_policy
+from . import codec
+
+if TYPE_CHECKING:
+    from wit_world.imports.poll import Pollable
+    from .tracing import TransactionTracer
+
+
+class PendingCompensation[Err](Protocol):
+    """
+    A compensating action that has been started but not finished yet, for example an outgoing HTTP
+    request or a remote worker invocation.
+
+    Returning it from a compensating action allows a failed transaction to roll back independent
+    operations concurrently.
+    """
+
+    def subscribe(self) -> "Pollable":
+        """
+        Returns a pollable that becomes ready when the compensating action has finished.
+        """
+        ...
+
+    def get(self) -> Result[None, Err]:
+        """
+        Returns the result of the finished compensating action.
+        """
+        ...
+
+
+type CompensationResult[Err] = Result[None, Err] | PendingCompensation[Err]
 
 
 @dataclass
@@ -18,26 +62,120 @@ class Operation[In, Out, Err]:
     """
     An operation that can be executed as part of transaction. Consists of an action and a compensating action
     that can undo the side effects of the action.
+
+    Operations in different groups are considered independent: when a fallible transaction fails, their
+    compensating actions may run concurrently. Compensating actions of operations in the same group
+    (including the default `None` group) are always executed one by one, in reverse order.
+
+    The name of the operation is used for tracing, it defaults to the name of the action function.
     """
 
     _execute: Callable[[In], Result[Out, Err]]
-    _compensate: Callable[[In, Out], Result[None, Err]]
+    _compensate: Callable[[In, Out], CompensationResult[Err]]
+    group: str | None = None
+    name: str = ""
+
+    def __post_init__(self) -> None:
+        if not self.name:
+            self.name = _function_name(self._execute)
 
     def execute(self, input: In) -> Result[Out, Err]:
         return self._execute(input)
 
-    def compensate(self, input: In, result: Out) -> Result[None, Err]:
+    def compensate(self, input: In, result: Out) -> CompensationResult[Err]:
         return self._compensate(input, result)
 
 
 def operation[In, Out, Err](
     execute: Callable[[In], Result[Out, Err]],
-    compensate: Callable[[In, Out], Result[None, Err]],
+    compensate: Callable[[In, Out], CompensationResult[Err]],
+    group: str | None = None,
+    name: str = "",
 ) -> Operation[In, Out, Err]:
     """
     Create a new Operation from two functions.
     """
-    return Operation(execute, compensate)
+    return Operation(execute, compensate, group, name)
+
+
+@dataclass
+class BatchOperation[In, Out, Err](Operation[list[In], list[Out], Err]):
+    """
+    An operation performed on many inputs with a single call. The action receives a list of inputs and returns
+    the list of corresponding results, the compensating action receives the inputs and results of a whole batch.
+
+    Transactions keep a single compensation record per batch. When `batch_size` is set, `execute_batch` splits
+    the inputs into batches of at most that size.
+    """
+
+    batch_size: int | None = None
+
+    def __post_init__(self) -> None:
+        super().__post_init__()
+        if self.batch_size is not None and self.batch_size <= 0:
+            raise ValueError(f"Batch size must be positive, got {self.batch_size}")
+
+    def batches(self, inputs: list[In]) -> Iterator[list[In]]:
+        if self.batch_size is None:
+            if inputs:
+                yield inputs
+        else:
+            for start in range(0, len(inputs), self.batch_size):
+                yield inputs[start : start + self.batch_size]
+
+
+def batch_operation[In, Out, Err](
+    execute: Callable[[list[In]], Result[list[Out], Err]],
+    compensate: Callable[[list[In], list[Out]], CompensationResult[Err]],
+    batch_size: int | None = None,
+    group: str | None = None,
+    name: str = "",
+) -> BatchOperation[In, Out, Err]:
+    """
+    Create a new BatchOperation from two functions working on lists of inputs.
+    """
+    return BatchOperation(execute, compensate, group, name, batch_size)
+
+
+@dataclass
+class Compensation[Err]:
+    """
+    A record of a successfully executed operation, used to run its compensating action.
+    """
+
+    operation: Operation[Any, Any, Err]
+    input: Any
+    result: Any
+
+    def run(self) -> CompensationResult[Err]:
+        return self.operation.compensate(self.input, self.result)
+
+
+def _function_name(f: Callable[..., Any]) -> str:
+    return getattr(f, "__qualname__", None) or type(f).__name__
+
+
+def _execute[In, Out, Err](
+    tracer: "TransactionTracer | None",
+    op: Operation[In, Out, Err],
+    input: In,
+    attempt: int = 1,
+) -> Result[Out, Err]:
+    if tracer is None:
+        return op.execute(input)
+    return tracer.trace("execute", op.name, lambda: op.execute(input), attempt)
+
+
+def _compensate[Err](
+    tracer: "TransactionTracer | None",
+    compensation: Compensation[Err],
+    attempt: int = 1,
+) -> CompensationResult[Err]:
+    if tracer is None:
+        return compensation.run()
+    return tracer.trace(
+        "compensate", compensation.operation.name, compensation.run, attempt
+    )
 
 
 @dataclass
@@ -74,31 +212,107 @@ class FallibleTransaction[Err]:
     returns with a failure.
     """
 
-    compensations: list[Callable[[], Result[None, Err]]]
+    compensations: list[Compensation[Err]]
+    tracer: "TransactionTracer | None" = None
 
     def execute[In, Out](
         self, op: Operation[In, Out, Err], input: In
     ) -> Result[Out, Err]:
-        result = op.execute(input)
+        result = _execute(self.tracer, op, input)
         if isinstance(result, Ok):
-            self.compensations.append(lambda: op.compensate(input, result.value))
+            self.compensations.append(Compensation(op, input, result.value))
         return result
 
+    def execute_batch[In, Out](
+        self, op: BatchOperation[In, Out, Err], inputs: list[In]
+    ) -> Result[list[Out], Err]:
+        """
+        Executes a batch operation on all the inputs, with one call per batch.
+        """
+        outputs: list[Out] = []
+        for batch in op.batches(inputs):
+            result = self.execute(op, batch)
+            if isinstance(result, types.Err):
+                return result
+            outputs.extend(result.value)
+        return Ok(outputs)
+
     def _on_failure(self, failure: Err) -> TransactionFailure[Err]:
+        chains: dict[str | None, list[Compensation[Err]]] = {}
         for compensation in self.compensations[::-1]:
-            comp_result = compensation()
-            if isinstance(comp_result, types.Err):
-                return FailedAndRolledBackPartially(failure, comp_result.value)
+            chains.setdefault(compensation.operation.group, []).append(compensation)
+        compensation_failure = _run_compensation_chains(
+            [iter(chain) for chain in chains.values()], self.tracer
+        )
+        if compensation_failure is not None:
+            return FailedAndRolledBackPartially(failure, compensation_failure.value)
         return FailedAndRolledBackCompletely(failure)
 
 
+def _run_compensation_chains[Err](
+    chains: list[Iterator[Compensation[Err]]],
+    tracer: "TransactionTracer | None",
+) -> types.Err[Err] | None:
+    # Runs each chain sequentially, but the chains concurrently with each other. Once a compensating action
+    # fails no new ones are started, but the already pending ones are awaited.
+    failure: types.Err[Err] | None = None
+    pending: list[tuple[PendingCompensation[Err], Iterator[Compensation[Err]]]] = []
+
+    def advance(chain: Iterator[Compensation[Err]]) -> None:
+        nonlocal failure
+        for compensation in chain:
+            if failure is not None:
+                return
+            result = _compensate(tracer, compensation)
+            if isinstance(result, types.Err):
+                failure = result
+            elif not isinstance(result, Ok):
+                pending.append((result, chain))
+                return
+
+    for chain in chains:
+        advance(chain)
+
+    if pending:
+        from wit_world.imports import poll
+
+        pollables = [compensation.subscribe() for compensation, _ in pending]
+        while pending:
+            ready = set(poll.poll(pollables))
+            finished = [pending[index] for index in sorted(ready)]
+            for index in sorted(ready, reverse=True):
+                # pollables are child resources, they have to be dropped before the result is taken
+                pollables.pop(index).__exit__(None, None, None)
+                pending.pop(index)
+            for compensation, chain in finished:
+                result = compensation.get()
+                if isinstance(result, types.Err):
+                    if failure is None:
+                        failure = result
+                else:
+                    advance(chain)
+                    for new_compensation, _ in pending[len(pollables) :]:
+                        pollables.append(new_compensation.subscribe())
+
+    return failure
+
+
+def _await_compensation[Err](result: CompensationResult[Err]) -> Result[None, Err]:
+    if isinstance(result, (Ok, types.Err)):
+        return result
+    with result.subscribe() as pollable:
+        pollable.block()
+    return result.get()
+
+
 def fallible_transaction[Out, Err](
     f: Callable[[FallibleTransaction[Err]], Result[Out, Err]],
+    tracer: "TransactionTracer | None" = None,
 ) -> TransactionResult[Out, Err]:
     """
     Execute a fallible transaction.
     """
-    transaction = FallibleTransaction([])
+    transaction = FallibleTransaction([], tracer)
     result = f(transaction)
     if isinstance(result, types.Err):
         return types.Err(transaction._on_failure(result.value))
@@ -114,39 +328,469 @@ class InfallibleTransaction:
     and the transaction gets retried, using Golem's active retry policy.
     """
 
-    compensations: list[Callable[[], None]]
+    compensations: list[Compensation[Any]]
     begin_oplog_index: int
+    tracer: "TransactionTracer | None" = None
 
     def execute[In, Out, Err](self, op: Operation[In, Out, Err], input: In) -> Out:
-        result = op.execute(input)
+        result = _execute(self.tracer, op, input)
         if isinstance(result, Ok):
-
-            def compensation() -> None:
-                comp_result = op.compensate(input, result.value)
-                if isinstance(comp_result, types.Err):
-                    raise ValueError(
-                        "Compensating actions are not allowed to fail in infallible transaction",
-                        comp_result.value,
-                    )
-                self.compensations.append(compensation)
-
+            self.compensations.append(Compensation(op, input, result.value))
             return result.value
         else:
             self._retry()
             raise ValueError("unreachable")
 
+    def execute_batch[In, Out, Err](
+        self, op: BatchOperation[In, Out, Err], inputs: list[In]
+    ) -> list[Out]:
+        """
+        Executes a batch operation on all the inputs, with one call per batch.
+        """
+        outputs: list[Out] = []
+        for batch in op.batches(inputs):
+            outputs.extend(self.execute(op, batch))
+        return outputs
+
     def _retry(self) -> None:
         # rollback all completed operations and try again
         for compensation in self.compensations[::-1]:
-            compensation()
+            comp_result = _await_compensation(_compensate(self.tracer, compensation))
+            if isinstance(comp_result, types.Err):
+                raise ValueError(
+                    "Compensating actions are not allowed to fail in infallible transaction",
+                    comp_result.value,
+                )
         set_oplog_index(self.begin_oplog_index)
 
 
-def infallible_transaction[Out](f: Callable[[InfallibleTransaction], Out]) -> Out:
+def infallible_transaction[Out](
+    f: Callable[[InfallibleTransaction], Out],
+    tracer: "TransactionTracer | None" = None,
+) -> Out:
     """
     Execute an infallible transaction.
     """
     with atomic_operation_context():
         begin_oplog_index = get_oplog_index()
-        transaction = InfallibleTransaction([], begin_oplog_index)
+        transaction = InfallibleTransaction([], begin_oplog_index, tracer)
         return f(transaction)
+
+
+class RetriesExhausted[Err](Exception):
+    """
+    Raised by `retrying_infallible_transaction` when the transaction failed in all of its attempts.
+    Carries the error of the operation that failed in the last attempt.
+    """
+
+    def __init__(self, attempts: int, error: Err) -> None:
+        super().__init__(f"Transaction failed after {attempts} attempts", error)
+        self.attempts = attempts
+        self.error = error
+
+
+class _RetryTransaction(Exception):
+    def __init__(self, error: Any) -> None:
+        super().__init__(error)
+        self.error = error
+
+
+@dataclass
+class RetryingInfallibleTransaction:
+    """
+    Variant of `InfallibleTransaction` with its own retry policy. If an operation returns with a failure,
+    the already executed operations are compensated, and after a backoff delay the whole transaction
+    function is executed again, in the same invocation.
+
+    The transaction function must let exceptions raised by `execute` propagate.
+    """
+
+    compensations: list[Compensation[Any]]
+    attempt: int = 1
+    tracer: "TransactionTracer | None" = None
+
+    def execute[In, Out, Err](self, op: Operation[In, Out, Err], input: In) -> Out:
+        result = _execute(self.tracer, op, input, self.attempt)
+        if isinstance(result, Ok):
+            self.compensations.append(Compensation(op, input, result.value))
+            return result.value
+        else:
+            self._rollback()
+            raise _RetryTransaction(result.value)
+
+    def execute_batch[In, Out, Err](
+        self, op: BatchOperation[In, Out, Err], inputs: list[In]
+    ) -> list[Out]:
+        """
+        Executes a batch operation on all the inputs, with one call per batch.
+        """
+        outputs: list[Out] = []
+        for batch in op.batches(inputs):
+            outputs.extend(self.execute(op, batch))
+        return outputs
+
+    def _rollback(self) -> None:
+        for compensation in self.compensations[::-1]:
+            comp_result = _await_compensation(
+                _compensate(self.tracer, compensation, self.attempt)
+            )
+            if isinstance(comp_result, types.Err):
+                raise ValueError(
+                    "Compensating actions are not allowed to fail in infallible transaction",
+                    comp_result.value,
+                )
+
+
+def retrying_infallible_transaction[Out](
+    f: Callable[[RetryingInfallibleTransaction], Out],
+    policy: RetryPolicy,
+    tracer: "TransactionTracer | None" = None,
+) -> Out:
+    """
+    Execute an infallible transaction, retrying it at most `policy.max_attempts` times in total.
+
+    Between attempts the transaction waits `policy.min_delay * policy.multiplier ** (attempt - 1)`
+    nanoseconds, capped at `policy.max_delay` and extended by a random jitter of up to
+    `policy.max_jitter_factor` times the delay. The policy is also set as the worker's retry policy
+    while the transaction runs. When all attempts failed, `RetriesExhausted` is raised.
+    """
+    with use_retry_policy(policy), atomic_operation_context():
+        attempt = 1
+        while True:
+            transaction = RetryingInfallibleTransaction([], attempt, tracer)
+            try:
+                return f(transaction)
+            except _RetryTransaction as retry:
+                if attempt >= policy.max_attempts:
+                    raise RetriesExhausted(attempt, retry.error) from None
+                time.sleep(retry_delay(policy, attempt) / 1_000_000_000)
+                attempt += 1
+
+
+def retry_delay(policy: RetryPolicy, attempt: int) -> int:
+    """
+    The delay in nanoseconds before retrying after the given (1-based) attempt failed.
+    """
+    delay = min(policy.min_delay * policy.multiplier ** (attempt - 1), policy.max_delay)
+    if policy.max_jitter_factor:
+        delay += delay * policy.max_jitter_factor * random.random()
+    return int(delay)
+
+
+_DURABLE_TRANSACTION_INTERFACE = "golem-cloud:transaction"
+
+
+@dataclass
+class DurableInfallibleTransaction:
+    """
+    Variant of `InfallibleTransaction` where every operation is a durable checkpoint.
+
+    The results of operations (and of compensating actions during a rollback) are persisted in the oplog,
+    encoded with `golem_cloud.codec`. If the worker gets restarted in the middle of the transaction,
+    the already completed operations are replayed from the oplog instead of being executed again, and only
+    the interrupted operation is retried. If an operation returns with a failure, the completed operations
+    get compensated and the transaction is retried, the same way as in `InfallibleTransaction`.
+
+    Results and errors of the operations must be encodable with `golem_cloud.codec`. So that an operation
+    behaves the same when executed live and when replayed, `execute` always returns the result decoded
+    from its encoding, which is also what the compensating action receives: dataclasses become dicts,
+    named tuples tuples, and subclasses of builtin types like `IntEnum` and `StrEnum` values of their base
+    type. Plain `Enum`s can not be encoded. Pass `result_type` to rebuild dataclasses from the decoded
+    result with `golem_cloud.codec.convert`, for example `Account` or `list[Account]`.
+
+    Operations are executed without persisting the oplog entries of the host calls they make, as only
+    the result of the whole operation is replayed.
+    """
+
+    compensations: list[Compensation[Any]]
+    begin_oplog_index: int
+    tracer: "TransactionTracer | None" = None
+    steps: int = 0
+
+    def execute[In, Out, Err](
+        self, op: Operation[In, Out, Err], input: In, result_type: Any = None
+    ) -> Out:
+        result = self._durable_step(
+            lambda: _execute(self.tracer, op, input), result_type
+        )
+        if isinstance(result, Ok):
+            self.compensations.append(Compensation(op, input, result.value))
+            return result.value
+        else:
+            self._retry()
+            raise ValueError("unreachable")
+
+    def execute_batch[In, Out, Err](
+        self,
+        op: BatchOperation[In, Out, Err],
+        inputs: list[In],
+        result_type: Any = None,
+    ) -> list[Out]:
+        """
+        Executes a batch operation on all the inputs, with one call (and one checkpoint) per batch.
+        `result_type` is the type of the result of a single input.
+        """
+        batch_type = None if result_type is None else list[result_type]
+        outputs: list[Out] = []
+        for batch in op.batches(inputs):
+            outputs.extend(self.execute(op, batch, batch_type))
+        return outputs
+
+    def _retry(self) -> None:
+        # rollback all completed operations and try again
+        for compensation in self.compensations[::-1]:
+            comp_result = self._durable_step(
+                lambda: _await_compensation(_compensate(self.tracer, compensation))
+            )
+            if isinstance(comp_result, types.Err):
+                raise ValueError(
+                    "Compensating actions are not allowed to fail in infallible transaction",
+                    comp_result.value,
+                )
+        set_oplog_index(self.begin_oplog_index)
+
+    def _durable_step[T, E](
+        self, run: Callable[[], Result[T, E]], result_type: Any = None
+    ) -> Result[T, E]:
+        from wit_world.imports.oplog import WrappedFunctionType_WriteRemote
+        from .durability import Durability
+
+        self.steps += 1
+        durability = Durability(
+            _DURABLE_TRANSACTION_INTERFACE,
+            f"step-{self.steps}",
+            WrappedFunctionType_WriteRemote(),
+        )
+        durability.enable_forced_commit()
+        if durability.is_live():
+            # the host calls of the operation must not be persisted before the entry of the step
+            with use_persistence_level(PersistenceLevel_PersistNothing()):
+                result = run()
+            response = codec.encode((isinstance(result, Ok), result.value))
+            durability.persist_serialized(b"", response)
+        else:
+            response, _ = durability.replay_serialized()
+        # decoded on both paths, so the live result is the same as the replayed one
+        ok, value = codec.decode(response)
+        return Ok(codec.convert(value, result_type)) if ok else types.Err(value)
+
+
+def durable_infallible_transaction[Out](
+    f: Callable[[DurableInfallibleTransaction], Out],
+    tracer: "TransactionTracer | None" = None,
+) -> Out:
+    """
+    Execute an infallible transaction with durable checkpoints.
+    """
+    transaction = DurableInfallibleTransaction([], get_oplog_index(), tracer)
+    return f(transaction)
+
+
+@dataclass
+class AsyncOperation[In, Out, Err]:
+    """
+    An operation whose action and compensating action are coroutines.
+    Groups have the same meaning as for `Operation`.
+    """
+
+    _execute: Callable[[In], Awaitable[Result[Out, Err]]]
+    _compensate: Callable[[In, Out], Awaitable[Result[None, Err]]]
+    group: str | None = None
+    name: str = ""
+
+    def __post_init__(self) -> None:
+        if not self.name:
+            self.name = _function_name(self._execute)
+
+    async def execute(self, input: In) -> Result[Out, Err]:
+        return await self._execute(input)
+
+    async def compensate(self, input: In, result: Out) -> Result[None, Err]:
+        return await self._compensate(input, result)
+
+
+def async_operation[In, Out, Err](
+    execute: Callable[[In], Awaitable[Result[Out, Err]]],
+    compensate: Callable[[In, Out], Awaitable[Result[None, Err]]],
+    group: str | None = None,
+    name: str = "",
+) -> AsyncOperation[In, Out, Err]:
+    """
+    Create a new AsyncOperation from two async functions.
+    """
+    return AsyncOperation(execute, compensate, group, name)
+
+
+@dataclass
+class AsyncCompensation[Err]:
+    """
+    A record of a successfully executed async operation, used to run its compensating action.
+    """
+
+    operation: AsyncOperation[Any, Any, Err]
+    input: Any
+    result: Any
+
+    async def run(self) -> Result[None, Err]:
+        return await self.operation.compensate(self.input, self.result)
+
+
+async def _execute_async[In, Out, Err](
+    tracer: "TransactionTracer | None", op: AsyncOperation[In, Out, Err], input: In
+) -> Result[Out, Err]:
+    if tracer is None:
+        return await op.execute(input)
+    return await tracer.trace_async("execute", op.name, lambda: op.execute(input))
+
+
+async def _compensate_async[Err](
+    tracer: "TransactionTracer | None", compensation: AsyncCompensation[Err]
+) -> Result[None, Err]:
+    if tracer is None:
+        return await compensation.run()
+    return await tracer.trace_async(
+        "compensate", compensation.operation.name, compensation.run
+    )
+
+
+async def _gather[Err](
+    tracer: "TransactionTracer | None",
+    compensations: list[AsyncCompensation[Err]],
+    steps: tuple[tuple[AsyncOperation[Any, Any, Err], Any], ...],
+) -> list[Result[Any, Err]]:
+    # exceptions are collected instead of propagated by gather, so that the operations that succeeded
+    # concurrently with a raising one still get their compensating actions recorded
+    results = await asyncio.gather(
+        *(_execute_async(tracer, op, input) for op, input in steps),
+        return_exceptions=True,
+    )
+    exception: BaseException | None = None
+    for (op, input), result in zip(steps, results):
+        if isinstance(result, Ok):
+            compensations.append(AsyncCompensation(op, input, result.value))
+        elif exception is None and not isinstance(result, types.Err):
+            exception = result
+    if exception is not None:
+        raise exception
+    return results
+
+
+@dataclass
+class AsyncFallibleTransaction[Err]:
+    """
+    Async variant of `FallibleTransaction`. Operations passed to `gather` are executed concurrently,
+    their compensating actions are recorded in the order the operations were given.
+    """
+
+    compensations: list[AsyncCompensation[Err]]
+    tracer: "TransactionTracer | None" = None
+
+    async def execute[In, Out](
+        self, op: AsyncOperation[In, Out, Err], input: In
+    ) -> Result[Out, Err]:
+        result = await _execute_async(self.tracer, op, input)
+        if isinstance(result, Ok):
+            self.compensations.append(AsyncCompensation(op, input, result.value))
+        return result
+
+    async def gather(
+        self, *steps: tuple[AsyncOperation[Any, Any, Err], Any]
+    ) -> list[Result[Any, Err]]:
+        """
+        Executes independent operations concurrently, returning their results in the order of the steps.
+        If an operation raises, the exception is re-raised once all the operations have finished, after
+        recording the compensating actions of the successful ones.
+        """
+        return await _gather(self.tracer, self.compensations, steps)
+
+    async def _on_failure(self, failure: Err) -> TransactionFailure[Err]:
+        chains: dict[str | None, list[AsyncCompensation[Err]]] = {}
+        for compensation in self.compensations[::-1]:
+            chains.setdefault(compensation.operation.group, []).append(compensation)
+
+        failures: list[types.Err[Err]] = []
+
+        async def run_chain(chain: list[AsyncCompensation[Err]]) -> None:
+            for compensation in chain:
+                if failures:
+                    return
+                result = await _compensate_async(self.tracer, compensation)
+                if isinstance(result, types.Err):
+                    failures.append(result)
+
+        await asyncio.gather(*(run_chain(chain) for chain in chains.values()))
+        if failures:
+            return FailedAndRolledBackPartially(failure, failures[0].value)
+        return FailedAndRolledBackCompletely(failure)
+
+
+async def async_fallible_transaction[Out, Err](
+    f: Callable[[AsyncFallibleTransaction[Err]], Awaitable[Result[Out, Err]]],
+    tracer: "TransactionTracer | None" = None,
+) -> TransactionResult[Out, Err]:
+    """
+    Execute an async fallible transaction.
+    """
+    transaction = AsyncFallibleTransaction([], tracer)
+    result = await f(transaction)
+    if isinstance(result, types.Err):
+        return types.Err(await transaction._on_failure(result.value))
+    else:
+        return result
+
+
+@dataclass
+class AsyncInfallibleTransaction:
+    """
+    Async variant of `InfallibleTransaction`. Operations passed to `gather` are executed concurrently,
+    their compensating actions are recorded in the order the operations were given.
+    """
+
+    compensations: list[AsyncCompensation[Any]]
+    begin_oplog_index: int
+    tracer: "TransactionTracer | None" = None
+
+    async def execute[In, Out, Err](
+        self, op: AsyncOperation[In, Out, Err], input: In
+    ) -> Out:
+        return (await self.gather((op, input)))[0]
+
+    async def gather(
+        self, *steps: tuple[AsyncOperation[Any, Any, Any], Any]
+    ) -> list[Any]:
+        """
+        Executes independent operations concurrently, returning their results in the order of the steps.
+        If any of them fails, the transaction is rolled back and retried. If an operation raises, the
+        exception is re-raised once all the operations have finished, after recording the compensating
+        actions of the successful ones.
+        """
+        results = await _gather(self.tracer, self.compensations, steps)
+        if all(isinstance(result, Ok) for result in results):
+            return [result.value for result in results]
+        else:
+            await self._retry()
+            raise ValueError("unreachable")
+
+    async def _retry(self) -> None:
+        # rollback all completed operations and try again
+        for compensation in self.compensations[::-1]:
+            comp_result = await _compensate_async(self.tracer, compensation)
+            if isinstance(comp_result, types.Err):
+                raise ValueError(
+                    "Compensating actions are not allowed to fail in infallible transaction",
+                    comp_result.value,
+                )
+        set_oplog_index(self.begin_oplog_index)
+
+
+async def async_infallible_transaction[Out](
+    f: Callable[[AsyncInfallibleTransaction], Awaitable[Out]],
+    tracer: "TransactionTracer | None" = None,
+) -> Out:
+    """
+    Execute an async infallible transaction.
+    """
+    with atomic_operation_context():
+        begin_oplog_index = get_oplog_index()
+        transaction = AsyncInfallibleTransaction([], begin_oplog_index, tracer)
+        return await f(transaction)
@@ -0,0 +1,135 @@
+from types import SimpleNamespace
+
+import pytest
+from wit_world.imports import poll
+from wit_world.imports.streams import StreamError_Closed
+from wit_world.types import Err
+
+from golem_cloud.blobstore import _fetch_ranges, _ranges, iter_blob, read_blob
+
+DATA = bytes(range(10))
+
+
+class FakeRead:
+    # the incoming value, body stream and pollable of a range read
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.reads = 0
+        self.exits = 0
+
+    def incoming_value_consume_async(self) -> "FakeRead":
+        return self
+
+    def subscribe(self) -> "FakeRead":
+        return self
+
+    def read(self, length: int) -> bytes:
+        # every other read finds no data, so that ranges take several polls
+        self.reads += 1
+        if self.reads % 2:
+            return b""
+        if not self.data:
+            raise Err(StreamError_Closed())
+        chunk, self.data = self.data[:length], self.data[length:]
+        return chunk
+
+    def __exit__(self, *args) -> None:
+        self.exits += 1
+
+    @property
+    def closed(self) -> bool:
+        # the incoming value, the stream and the pollable were all dropped
+        return self.exits == 3
+
+
+class FakeContainer:
+    def __init__(self, data: bytes, size: int | None = None) -> None:
+        self.data = data
+        self.size = len(data) if size is None else size
+        self.reads: list[FakeRead] = []
+        self.max_open = 0
+
+    def object_info(self, name: str) -> SimpleNamespace:
+        return SimpleNamespace(size=self.size)
+
+    def get_data(self, name: str, start: int, end: int) -> FakeRead:
+        read = FakeRead(self.data[start : end + 1])
+        self.reads.append(read)
+        self.max_open = max(self.max_open, sum(not read.closed for read in self.reads))
+        return read
+
+
+@pytest.fixture(autouse=True)
+def ready_last(monkeypatch):
+    # only the most recently started read gets ready in each poll
+    monkeypatch.setattr(poll, "poll", lambda pollables: [len(pollables) - 1])
+
+
+def fetch(container: FakeContainer, ordered: bool) -> list[tuple[int, bytes, int]]:
+    # the index and data of each yielded range, with the number of reads started when it was yielded
+    return [
+        (index, bytes(buffer), len(container.reads))
+        for index, buffer in _fetch_ranges(
+            container,
+            "object",
+            _ranges(len(DATA), 3),
+            lambda start, length: memoryview(bytearray(length)),
+            concurrency=2,
+            ordered=ordered,
+        )
+    ]
+
+
+def test_unordered_fetch_yields_ranges_as_they_complete():
+    container = FakeContainer(DATA)
+    assert fetch(container, ordered=False) == [
+        (1, DATA[3:6], 2),
+        (2, DATA[6:9], 3),
+        (3, DATA[9:], 4),
+        (0, DATA[:3], 4),
+    ]
+    assert container.max_open == 2
+    assert all(read.closed for read in container.reads)
+
+
+def test_ordered_fetch_only_starts_ranges_after_the_last_yielded_one():
+    container = FakeContainer(DATA)
+    assert fetch(container, ordered=True) == [
+        (0, DATA[:3], 2),
+        (1, DATA[3:6], 2),
+        (2, DATA[6:9], 4),
+        (3, DATA[9:], 4),
+    ]
+    assert container.max_open == 2
+    assert all(read.closed for read in container.reads)
+
+
+@pytest.mark.parametrize("concurrency", [1, 3, 8])
+def test_read_blob_bounds_the_concurrent_reads(concurrency):
+    container = FakeContainer(DATA * 3)
+    assert read_blob(container, "object", range_size=4, concurrency=concurrency) == (
+        DATA * 3
+    )
+    assert len(container.reads) == 8
+    assert container.max_open == concurrency
+    assert b"".join(iter_blob(container, "object", 4, concurrency)) == DATA * 3
+    assert container.max_open == concurrency
+
+
+def test_closing_the_iterator_closes_the_active_reads(monkeypatch):
+    monkeypatch.setattr(poll, "poll", lambda pollables: [0])
+    container = FakeContainer(DATA)
+    blob = iter_blob(container, "object", range_size=3, concurrency=2)
+    assert bytes(next(blob)) == DATA[:3]
+    assert len(container.reads) == 2
+    assert not container.reads[1].closed
+    blob.close()
+    assert len(container.reads) == 2
+    assert all(read.closed for read in container.reads)
+
+
+def test_short_object_raises_value_error():
+    container = FakeContainer(DATA[:8], size=len(DATA))
+    with pytest.raises(ValueError, match="1 bytes before the end of a range"):
+        read_blob(container, "object", range_size=3, concurrency=2)
+    assert all(read.closed for read in container.reads)
@@ -0,0 +1,141 @@
+import array
+import enum
+import pickle
+from collections import OrderedDict, namedtuple
+from dataclasses import dataclass
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+
+from golem_cloud import codec
+
+
+@dataclass
+class Item:
+    name: str
+    quantity: int
+
+
+@dataclass
+class Order:
+    id: int
+    items: list[Item]
+    note: str | None = None
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        False,
+        0,
+        127,
+        128,
+        2**80,
+        -1,
+        -(2**70),
+        1.5,
+        "",
+        "text",
+        "ünïcode",
+        b"\x00\xff",
+        [1, "a", None],
+        (1, (2, 3)),
+        {"a": 1, 2: [3]},
+        {1, 2, 3},
+        frozenset({1, 2}),
+        {frozenset({1}): 1},
+        {frozenset({1}), frozenset()},
+        bytearray(b"\x00"),
+        array.array("d", [1.0, 2.5]),
+        datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+        date(2024, 5, 1),
+        time(12, 30, 1),
+        Decimal("1.25"),
+        UUID("12345678-1234-5678-1234-567812345678"),
+    ],
+)
+def test_round_trip(value):
+    assert codec.decode(codec.encode(value)) == value
+
+
+def test_decode_as_rebuilds_nested_dataclasses():
+    order = Order(1, [Item("apple", 2), Item("pear", 1)])
+    assert codec.decode(codec.encode(order)) == {
+        "id": 1,
+        "items": [{"name": "apple", "quantity": 2}, {"name": "pear", "quantity": 1}],
+        "note": None,
+    }
+    assert codec.decode_as(codec.encode(order), Order) == order
+    assert codec.decode_as(codec.encode({"a": order}), dict[str, Order]) == {"a": order}
+
+
+def test_repeated_strings_are_encoded_as_references():
+    rows = [{"name": "apple", "quantity": n} for n in range(10)]
+    encoded = codec.encode(rows)
+    assert encoded.count(b"apple") == 1
+    assert encoded.count(b"quantity") == 1
+    assert codec.decode(encoded) == rows
+
+
+def test_encode_into_appends():
+    out = bytearray(b"prefix")
+    codec.encode_into([1, 2], out)
+    assert out.startswith(b"prefix")
+    assert codec.decode(out[len(b"prefix") :]) == [1, 2]
+
+
+@pytest.mark.parametrize("value", [[1, 2, 3], "text", 2**80, b"bytes", {"a": "b"}, 1.5])
+def test_truncated_input_is_rejected(value):
+    encoded = codec.encode(value)
+    for length in range(len(encoded)):
+        with pytest.raises(ValueError):
+            codec.decode(encoded[:length])
+
+
+def test_invalid_input_is_rejected():
+    with pytest.raises(ValueError, match="Trailing data"):
+        codec.decode(codec.encode(1) + b"\x00")
+    with pytest.raises(ValueError, match="Invalid encoded value"):
+        codec.decode(b"\xff")
+
+
+def test_globals_other_than_the_supported_types_are_rejected():
+    with pytest.raises(ValueError, match="Unsupported global"):
+        codec.decode(pickle.dumps(Item("apple", 1)))
+    with pytest.raises(ValueError, match="Unsupported global"):
+        codec.decode(pickle.dumps(print))
+
+
+def test_unsupported_types_are_rejected():
+    with pytest.raises(TypeError):
+        codec.encode(object())
+
+
+class Color(enum.IntEnum):
+    RED = 1
+
+
+class Size(enum.StrEnum):
+    SMALL = "s"
+
+
+Point = namedtuple("Point", "x y")
+
+
+def test_subclasses_are_decoded_as_their_base_type():
+    decoded = codec.decode(
+        codec.encode([Color.RED, Size.SMALL, Point(1, 2), OrderedDict(a=1)])
+    )
+    assert decoded == [1, "s", (1, 2), {"a": 1}]
+    assert [type(value) for value in decoded] == [int, str, tuple, dict]
+
+
+def test_unsupported_types_are_rejected_when_nested():
+    with pytest.raises(TypeError):
+        codec.encode({"a": [enum.Enum("Plain", "A").A]})
+    with pytest.raises(TypeError):
+        codec.encode([Item])
@@ -0,0 +1,53 @@
+import pytest
+from wit_world.imports.host import RetryPolicy
+from wit_world.types import Err
+
+from golem_cloud import host
+from golem_cloud.transaction import retrying_infallible_transaction
+
+
+@pytest.fixture
+def calls(monkeypatch) -> list[tuple]:
+    calls = []
+    settings = {"policy": "original"}
+
+    def set_retry_policy(policy):
+        calls.append(("set_retry_policy", policy))
+        settings["policy"] = policy
+
+    monkeypatch.setattr(host, "mark_begin_operation", lambda: 3)
+    monkeypatch.setattr(
+        host, "mark_end_operation", lambda index: calls.append(("end", index))
+    )
+    monkeypatch.setattr(host, "get_retry_policy", lambda: settings["policy"])
+    monkeypatch.setattr(host, "set_retry_policy", set_retry_policy)
+    return calls
+
+
+def test_err_is_raised_through_the_context_managers(calls):
+    with pytest.raises(Err) as raised:
+        with host.use_retry_policy("policy"), host.atomic_operation_context():
+            raise Err("failed")
+    assert raised.value == Err("failed")
+    assert calls == [
+        ("set_retry_policy", "policy"),
+        ("set_retry_policy", "original"),
+    ]
+
+
+def test_atomic_operation_is_ended_on_success(calls):
+    with host.atomic_operation_context():
+        pass
+    assert calls == [("end", 3)]
+
+
+def test_err_is_raised_from_retrying_infallible_transaction(calls):
+    policy = RetryPolicy(3, 0, 0, 1.0, None)
+
+    def run(tx):
+        raise Err("host error")
+
+    with pytest.raises(Err) as raised:
+        retrying_infallible_transaction(run, policy)
+    assert raised.value == Err("host error")
+    assert calls[-1] == ("set_retry_policy", "original")
@@ -0,0 +1,235 @@
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import pytest
+from wit_world.types import Err
+
+from golem_cloud import keyvalue
+from golem_cloud.keyvalue import (
+    KeyIndex,
+    KeyValueBatch,
+    KeyValueClient,
+    KVStore,
+    StructCodec,
+    ZlibCodec,
+    codec_for,
+    scan_keys,
+)
+
+
+class FakeStore:
+    def __init__(self) -> None:
+        self.values: dict[str, bytes] = {}
+        self.fail: Err | None = None
+        self.calls: list[str] = []
+
+    def get_many(self, bucket, keys: list[str]) -> list[bytes | None]:
+        self.calls.append("get_many")
+        if self.fail is not None:
+            raise self.fail
+        return [self.values.get(key) for key in keys]
+
+    def get(self, bucket, key: str) -> bytes | None:
+        return self.get_many(bucket, [key])[0]
+
+    def exists(self, bucket, key: str) -> bool:
+        return self.get(bucket, key) is not None
+
+    def write_many(self, bucket, writes: dict[str, bytes | None]) -> None:
+        self.calls.append("write_many")
+        if self.fail is not None:
+            raise self.fail
+        for key, value in writes.items():
+            if value is None:
+                self.values.pop(key, None)
+            else:
+                self.values[key] = value
+
+
+@pytest.fixture
+def store(monkeypatch) -> FakeStore:
+    store = FakeStore()
+    monkeypatch.setattr(keyvalue.eventual_batch, "get_many", store.get_many)
+    monkeypatch.setattr(keyvalue.eventual, "get", store.get)
+    monkeypatch.setattr(keyvalue.eventual, "exists", store.exists)
+    monkeypatch.setattr(keyvalue, "_write_many", store.write_many)
+    monkeypatch.setattr(keyvalue, "_consume", lambda incoming: incoming)
+    return store
+
+
+def test_batch_dispatches_reads_and_writes_once(store):
+    store.values = {"a": b"1", "b": b"2"}
+    with KeyValueBatch(object()) as batch:
+        a = batch.get("a")
+        batch.set("b", b"3")
+        b = batch.get("b")
+        batch.delete("a")
+        missing = batch.get("c")
+    assert (a.result(), b.result(), missing.result()) == (b"1", b"3", None)
+    assert store.values == {"b": b"3"}
+    assert store.calls == ["get_many", "write_many"]
+
+
+def test_failed_reads_raise_from_results_and_keep_writes(store):
+    batch = KeyValueBatch(object())
+    a = batch.get("a")
+    batch.set("b", b"1")
+    store.fail = Err("unavailable")
+    with pytest.raises(Err):
+        batch.dispatch()
+    assert a.done
+    with pytest.raises(Err) as error:
+        a.result()
+    assert error.value == Err("unavailable")
+
+    store.fail = None
+    batch.dispatch()
+    assert store.values == {"b": b"1"}
+
+
+def test_result_dispatches_the_batch(store):
+    store.values = {"a": b"1"}
+    batch = KeyValueBatch(object())
+    a = batch.get("a")
+    assert not a.done
+    assert a.result() == b"1"
+    assert store.calls == ["get_many"]
+
+
+@pytest.fixture
+def listed_keys(monkeypatch) -> list[list[str]]:
+    listings = []
+
+    def keys(bucket) -> list[str]:
+        listings.append(list(bucket))
+        return list(bucket)
+
+    monkeypatch.setattr(keyvalue.eventual_batch, "keys", keys)
+    return listings
+
+
+def test_index_scan_respects_prefix_start_after_and_limit(listed_keys):
+    index = KeyIndex(["b/2", "a", "b/1", "b", "c", "b/3", "b0"])
+    assert index.scan("b/") == ["b/1", "b/2", "b/3"]
+    assert index.scan("b/", start_after="b/1") == ["b/2", "b/3"]
+    assert index.scan("b/", start_after="a") == ["b/1", "b/2", "b/3"]
+    assert index.scan("b/", limit=2) == ["b/1", "b/2"]
+    assert index.scan("b") == ["b", "b/1", "b/2", "b/3", "b0"]
+    assert index.scan() == ["a", "b", "b/1", "b/2", "b/3", "b0", "c"]
+    assert len(listed_keys) == 1
+
+
+def test_index_pages_resume_after_the_last_key(listed_keys):
+    index = KeyIndex([f"k{i}" for i in range(5)] + ["other"])
+    pages = index.pages("k", page_size=2)
+    assert next(pages) == ["k0", "k1"]
+    index.discard("k2")
+    index.add("k1a")
+    assert list(pages) == [["k1a", "k3"], ["k4"]]
+    assert list(index.pages("k", page_size=5)) == [["k0", "k1", "k1a", "k3", "k4"]]
+    assert list(index.pages("missing")) == []
+
+
+def test_index_applies_changes_made_before_listing(listed_keys):
+    index = KeyIndex(["a", "b"])
+    index.add("c")
+    index.discard("a")
+    assert listed_keys == []
+    assert index.scan() == ["b", "c"]
+    assert "c" in index and "a" not in index
+    index.add("c")
+    index.add("a")
+    assert len(index) == 3
+    index.refresh()
+    assert index.scan() == ["a", "b"]
+
+
+def test_scan_with_prefix_of_the_largest_character(listed_keys):
+    top = "\U0010ffff"
+    keys = ["a", "a" + top, "a" + top + "x", "b", top, top + top]
+    assert keyvalue._prefix_end("a" + top) == "b"
+    assert keyvalue._prefix_end(top) is None
+    assert KeyIndex(keys).scan("a" + top) == ["a" + top, "a" + top + "x"]
+    assert KeyIndex(keys).scan(top) == [top, top + top]
+    assert list(scan_keys(keys, "a", page_size=2)) == [
+        ["a", "a" + top],
+        ["a" + top + "x"],
+    ]
+
+
+def test_client_keeps_buffered_writes_when_flush_fails(store):
+    client = KeyValueClient(object())
+    client.set("a", b"1")
+    client.delete("b")
+    store.values = {"b": b"old"}
+    store.fail = Err("unavailable")
+    with pytest.raises(Err):
+        client.flush()
+    assert client.get("a") == b"1"
+    assert client.get("b") is None
+    store.fail = None
+    client.flush()
+    assert store.values == {"a": b"1"}
+    assert client.stats.flushed_writes == 2
+
+
+@dataclass
+class Point:
+    x: int
+    y: float
+
+
+class Pair(NamedTuple):
+    left: int
+    right: int
+
+
+def test_struct_codec_round_trips_records_and_single_values():
+    point = StructCodec("<id", Point)
+    assert point.decode(point.encode(Point(1, 2.5))) == Point(1, 2.5)
+    assert len(point.encode(Point(1, 2.5))) == 12
+    pair = StructCodec("<HH", Pair)
+    assert pair.decode(pair.encode(Pair(3, 4))) == Pair(3, 4)
+    assert StructCodec("<hh").decode(StructCodec("<hh").encode((5, -6))) == (5, -6)
+    single = StructCodec("<d")
+    assert single.decode(single.encode(1.5)) == 1.5
+    assert single.decode(single.encode((2.5,))) == 2.5
+
+
+def test_zlib_codec_compresses_long_values_only():
+    codec = ZlibCodec(codec_for(bytes), threshold=16)
+    short = codec.encode(b"abc")
+    assert short == b"\x00abc"
+    long = codec.encode(b"a" * 1000)
+    assert long[:1] == b"\x01" and len(long) < 100
+    assert codec.decode(short) == b"abc"
+    assert codec.decode(long) == b"a" * 1000
+    assert codec.encode(bytes(range(20)))[:1] == b"\x00"
+
+
+def test_kv_store_encodes_keys_and_values(store):
+    points: KVStore[int, Point] = KVStore(object(), Point, key=lambda id: f"point:{id}")
+    points[1] = Point(1, 2.5)
+    points.set(2, Point(3, 4.5))
+    assert set(store.values) == {"point:1", "point:2"}
+    assert points[1] == Point(1, 2.5)
+    assert points.get_many([2, 3]) == [Point(3, 4.5), None]
+    assert 1 in points and 3 not in points
+    del points[1]
+    assert "point:1" not in store.values
+    assert points.get(1) is None
+    with pytest.raises(KeyError):
+        points[1]
+
+
+def test_kv_store_compresses_and_buffers_through_a_client(store):
+    client = KeyValueClient(object(), flush_interval=60)
+    texts: KVStore[str, str] = KVStore(client, str, compress_threshold=64)
+    texts["long"] = "x" * 1000
+    texts["short"] = "y"
+    assert store.values == {}
+    assert texts["long"] == "x" * 1000
+    texts.flush()
+    assert store.values["short"] == b"\x00y"
+    assert len(store.values["long"]) < 100
+    assert KVStore(object(), str, compress_threshold=64)["long"] == "x" * 1000
@@ -0,0 +1,518 @@
+import array
+import ipaddress
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+from wit_world.imports import mysql as host_mysql
+from wit_world.imports import golem_rdbms_types
+from wit_world.imports import postgres as host_postgres
+from wit_world.types import Err
+
+from golem_cloud import durability, host
+from golem_cloud.rdbms import mysql, postgres
+from golem_cloud.rdbms.common import ValueEncoder, insert_statements
+from golem_cloud.rdbms.pool import ConnectionPool
+
+identity = ValueEncoder({int: lambda value: value, str: lambda value: value})
+
+
+def test_insert_statements_split_rows_by_parameter_limit():
+    rows = [(n, f"name{n}") for n in range(5)]
+    statements = list(
+        insert_statements("users", ["id", "name"], rows, 4, "${}".format, identity)
+    )
+    assert statements == [
+        (
+            "INSERT INTO users (id, name) VALUES ($1, $2), ($3, $4)",
+            [0, "name0", 1, "name1"],
+        ),
+        (
+            "INSERT INTO users (id, name) VALUES ($1, $2), ($3, $4)",
+            [2, "name2", 3, "name3"],
+        ),
+        ("INSERT INTO users (id, name) VALUES ($1, $2)", [4, "name4"]),
+    ]
+
+
+def test_insert_statements_reject_invalid_rows():
+    with pytest.raises(ValueError):
+        list(insert_statements("t", [], [()], 10, "${}".format, identity))
+    with pytest.raises(ValueError):
+        list(insert_statements("t", ["a", "b", "c"], [], 2, "${}".format, identity))
+    with pytest.raises(ValueError):
+        list(insert_statements("t", ["a", "b"], [(1,)], 10, "${}".format, identity))
+
+
+def test_insert_statements_without_rows():
+    assert list(insert_statements("t", ["a"], [], 10, "${}".format, identity)) == []
+
+
+class FakePostgresTransaction(host_postgres.DbTransaction):
+    def __init__(self) -> None:
+        self.executed: list[tuple[str, list]] = []
+
+    def execute(self, statement: str, params: list) -> int:
+        self.executed.append((statement, params))
+        return 1
+
+
+def test_insert_columns_passes_columns_as_array_literals():
+    transaction = FakePostgresTransaction()
+    columns = {
+        "id": [1, 2, 3],
+        "name": ['a "quoted" name', "back\\slash", None],
+        "created": [datetime(2024, 1, 1, tzinfo=timezone.utc), None, None],
+        "amount": [Decimal("1.5"), None, None],
+    }
+    assert postgres.insert_columns(transaction, "t", columns, batch_size=2) == 2
+    statement = (
+        "INSERT INTO t (id, name, created, amount) SELECT * FROM unnest("
+        "$1::text::int8[], $2::text::text[], $3::text::timestamptz[], $4::text::numeric[])"
+    )
+    assert transaction.executed == [
+        (
+            statement,
+            [
+                host_postgres.DbValue_Text('{"1","2"}'),
+                host_postgres.DbValue_Text('{"a \\"quoted\\" name","back\\\\slash"}'),
+                host_postgres.DbValue_Text('{"2024-01-01T00:00:00+00:00",NULL}'),
+                host_postgres.DbValue_Text('{"1.5",NULL}'),
+            ],
+        ),
+        (
+            statement,
+            [
+                host_postgres.DbValue_Text('{"3"}'),
+                host_postgres.DbValue_Text("{NULL}"),
+                host_postgres.DbValue_Text("{NULL}"),
+                host_postgres.DbValue_Text("{NULL}"),
+            ],
+        ),
+    ]
+
+
+def test_insert_columns_uses_given_types():
+    transaction = FakePostgresTransaction()
+    columns = {
+        "id": [UUID(int=1)],
+        "day": [date(2024, 1, 2)],
+        "data": [b"\x01\xff"],
+        "flag": [True],
+    }
+    postgres.insert_columns(transaction, "t", columns, {"day": "date", "flag": "bool"})
+    statement, params = transaction.executed[0]
+    assert statement.endswith(
+        "unnest($1::text::uuid[], $2::text::date[], $3::text::bytea[], $4::text::bool[])"
+    )
+    assert params == [
+        host_postgres.DbValue_Text('{"00000000-0000-0000-0000-000000000001"}'),
+        host_postgres.DbValue_Text('{"2024-01-02"}'),
+        host_postgres.DbValue_Text('{"\\\\x01ff"}'),
+        host_postgres.DbValue_Text("{t}"),
+    ]
+
+
+def test_insert_columns_falls_back_to_lazy_values(monkeypatch):
+    monkeypatch.setattr(host_postgres, "LazyDbValue", lambda value: value)
+    transaction = FakePostgresTransaction()
+    postgres.insert_columns(transaction, "t", {"mixed": [1, "a"]}, batch_size=10)
+    statement, params = transaction.executed[0]
+    assert statement.endswith("unnest($1)")
+    assert params == [
+        host_postgres.DbValue_Array(
+            [host_postgres.DbValue_Int8(1), host_postgres.DbValue_Text("a")]
+        )
+    ]
+
+
+def test_postgres_named_parameters():
+    query = postgres.Query(
+        "select :a, :b, :a, x::int, ':c', 'it''s :c', E'it\\'s :c', $$ :d $$, $t$ :e $t$, "
+        '":f" -- :g\n/* :h */ from t where y = :b'
+    )
+    assert query.statement == (
+        "select $1, $2, $1, x::int, ':c', 'it''s :c', E'it\\'s :c', $$ :d $$, $t$ :e $t$, "
+        '":f" -- :g\n/* :h */ from t where y = $2'
+    )
+    assert query.names == ("a", "b")
+    assert query.params({"a": 1, "b": "x"}) == [
+        host_postgres.DbValue_Int8(1),
+        host_postgres.DbValue_Text("x"),
+    ]
+
+
+def test_mysql_named_parameters():
+    query = mysql.Query(
+        "select 'it\\'s :a', \"say \\\":b\\\"\", 'it''s :c', `:d`, :e, :e "
+        "# :f\n-- :g\n/* :h */ where x = :i"
+    )
+    assert query.statement == (
+        "select 'it\\'s :a', \"say \\\":b\\\"\", 'it''s :c', `:d`, ?, ? "
+        "# :f\n-- :g\n/* :h */ where x = ?"
+    )
+    assert query.names == ("e", "e", "i")
+    assert query.params({"e": 1, "i": None}) == [
+        host_mysql.DbValue_Bigint(1),
+        host_mysql.DbValue_Bigint(1),
+        host_mysql.DbValue_Null(),
+    ]
+
+
+def test_missing_named_parameter():
+    with pytest.raises(ValueError, match="Missing value of parameter b"):
+        postgres.Query("select :a, :b").params({"a": 1})
+
+
+class FakeDbTransaction:
+    def __init__(self, log: list[str], fail_commit: bool) -> None:
+        self.log = log
+        self.fail_commit = fail_commit
+
+    def commit(self) -> None:
+        self.log.append("commit")
+        if self.fail_commit:
+            raise Err("commit failed")
+
+    def rollback(self) -> None:
+        self.log.append("rollback")
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class FakeDbConnection:
+    def __init__(self, log: list[str], fail_commit: bool = False) -> None:
+        self.log = log
+        self.fail_commit = fail_commit
+
+    def query(self, statement: str, params: list) -> None:
+        pass
+
+    def begin_transaction(self) -> FakeDbTransaction:
+        return FakeDbTransaction(self.log, self.fail_commit)
+
+    def __exit__(self, *args) -> None:
+        self.log.append("close")
+
+
+def test_pool_reuses_connections():
+    log: list[str] = []
+    opened: list[FakeDbConnection] = []
+
+    def open(address: str) -> FakeDbConnection:
+        opened.append(FakeDbConnection(log))
+        return opened[-1]
+
+    pool = ConnectionPool(open, max_size=1)
+    with pool.connection("db") as first:
+        with pool.connection("db") as overflow:
+            assert overflow is not first
+        assert log == ["close"]
+    with pool.connection("db") as second:
+        assert second is first
+    assert pool.size("db") == 1
+    pool.close()
+    assert log == ["close", "close"]
+
+
+def test_pool_propagates_errors_and_drops_connections():
+    log: list[str] = []
+    pool = ConnectionPool(lambda address: FakeDbConnection(log))
+    with pytest.raises(Err) as error:
+        with pool.connection("db"):
+            raise Err("query failed")
+    assert error.value == Err("query failed")
+    assert log == ["close"]
+
+    log.clear()
+    with pytest.raises(Err):
+        with pool.transaction("db"):
+            raise Err("query failed")
+    assert log == ["rollback", "close"]
+
+
+def test_pool_transaction_commit_failure():
+    log: list[str] = []
+    pool = ConnectionPool(lambda address: FakeDbConnection(log, fail_commit=True))
+    with pytest.raises(Err) as error:
+        with pool.transaction("db"):
+            pass
+    assert error.value == Err("commit failed")
+    assert log == ["commit", "close"]
+    assert pool.size("db") == 0
+
+
+class FakeResultStream:
+    def __init__(self, columns, pages) -> None:
+        self.columns = columns
+        self.pages = list(pages)
+        self.closed = False
+
+    def get_columns(self):
+        return self.columns
+
+    def get_next(self):
+        return self.pages.pop(0) if self.pages else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.closed = True
+
+
+class FakeStreamConnection:
+    def __init__(self, stream: FakeResultStream) -> None:
+        self.stream = stream
+
+    def query_stream(self, statement, params):
+        return self.stream
+
+
+def pg_row(*values):
+    return host_postgres.DbRow(list(values))
+
+
+def test_fetch_columns_builds_typed_columns():
+    null = host_postgres.DbValue_Null()
+    columns = [
+        host_postgres.DbColumn(0, "id", host_postgres.DbColumnType_Int4(), "int4"),
+        host_postgres.DbColumn(1, "name", host_postgres.DbColumnType_Text(), "text"),
+        host_postgres.DbColumn(2, "day", host_postgres.DbColumnType_Date(), "date"),
+    ]
+    day = host_postgres.DbValue_Date(golem_rdbms_types.Date(2024, 5, 1))
+    pages = [
+        [
+            pg_row(host_postgres.DbValue_Int4(1), host_postgres.DbValue_Text("a"), day),
+            pg_row(
+                host_postgres.DbValue_Int4(2), host_postgres.DbValue_Text("b"), null
+            ),
+        ],
+        [],
+        [pg_row(null, host_postgres.DbValue_Text("a"), day)],
+    ]
+    stream = FakeResultStream(columns, pages)
+    result = postgres.fetch_columns(FakeStreamConnection(stream), "SELECT")
+    assert stream.closed
+    assert len(result) == 3
+    assert result.column("id") == array.array("i", [1, 2, 0])
+    assert result.null_mask("id") == bytearray([0, 0, 1])
+    assert result.column("name").to_list() == ["a", "b", "a"]
+    assert result.column("name").values == ["a", "b"]
+    assert result.null_mask("name") is None
+    assert result.column("day") == [date(2024, 5, 1), None, date(2024, 5, 1)]
+
+
+def test_fetch_columns_returns_none_for_null_strings():
+    null = host_postgres.DbValue_Null()
+    columns = [
+        host_postgres.DbColumn(0, "a", host_postgres.DbColumnType_Text(), "text"),
+        host_postgres.DbColumn(1, "b", host_postgres.DbColumnType_Text(), "text"),
+    ]
+    pages = [
+        [pg_row(null, host_postgres.DbValue_Text("x"))],
+        [pg_row(null, null), pg_row(null, host_postgres.DbValue_Text("y"))],
+    ]
+    result = postgres.fetch_columns(
+        FakeStreamConnection(FakeResultStream(columns, pages)), "SELECT"
+    )
+    all_null = result.column("a")
+    assert all_null.values == []
+    assert all_null.to_list() == [None, None, None]
+    assert all_null[1] is None
+    some_null = result.column("b")
+    assert some_null.to_list() == ["x", None, "y"]
+    assert (some_null[0], some_null[1]) == ("x", None)
+
+
+class FakeQueryDurability:
+    oplog: list[bytes] = []
+    live = True
+    ended = 0
+
+    def __init__(self, interface, function, function_type) -> None:
+        pass
+
+    def is_live(self) -> bool:
+        return FakeQueryDurability.live
+
+    def persist_serialized(self, input: bytes, result: bytes) -> None:
+        FakeQueryDurability.oplog.append(result)
+
+    def replay_serialized(self) -> tuple[bytes, int]:
+        return FakeQueryDurability.oplog.pop(0), 1
+
+    def end(self) -> None:
+        FakeQueryDurability.ended += 1
+
+
+@pytest.fixture
+def query_durability(monkeypatch):
+    FakeQueryDurability.oplog = []
+    FakeQueryDurability.live = True
+    FakeQueryDurability.ended = 0
+    monkeypatch.setattr(durability, "Durability", FakeQueryDurability)
+    monkeypatch.setattr(host, "get_oplog_persistence_level", lambda: None)
+    monkeypatch.setattr(host, "set_oplog_persistence_level", lambda level: None)
+    return FakeQueryDurability
+
+
+class FakeQueryConnection:
+    def __init__(self, result) -> None:
+        self.result = result
+
+    def query(self, statement, params):
+        if isinstance(self.result, Err):
+            raise self.result
+        return self.result
+
+
+class Lazy:
+    def __init__(self, value) -> None:
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def test_durable_query_returns_the_same_rows_live_and_on_replay(query_durability):
+    columns = [
+        host_postgres.DbColumn(
+            0, "i", host_postgres.DbColumnType_Interval(), "interval"
+        ),
+        host_postgres.DbColumn(1, "ip", host_postgres.DbColumnType_Inet(), "inet"),
+    ]
+    row = host_postgres.DbRow(
+        [
+            host_postgres.DbValue_Interval(host_postgres.Interval(1, 2, 3)),
+            host_postgres.DbValue_Inet(golem_rdbms_types.IpAddress_Ipv4((10, 0, 0, 1))),
+        ]
+    )
+    connection = FakeQueryConnection(host_postgres.DbResult(columns, [row]))
+    live = postgres.durable_query(connection, "SELECT")
+    query_durability.live = False
+    replayed = postgres.durable_query(connection, "SELECT")
+    assert live == replayed
+    assert live == [
+        (
+            {"months": 1, "days": 2, "microseconds": 3},
+            ipaddress.IPv4Address("10.0.0.1"),
+        )
+    ]
+
+
+def test_durable_query_rejects_range_columns(query_durability):
+    int4range = host_postgres.DbColumnType_Int4range()
+    for db_type in [int4range, host_postgres.DbColumnType_Array(Lazy(int4range))]:
+        column = host_postgres.DbColumn(0, "r", db_type, "int4range")
+        connection = FakeQueryConnection(host_postgres.DbResult([column], []))
+        with pytest.raises(TypeError):
+            postgres.durable_query(connection, "SELECT")
+    assert query_durability.oplog == []
+    assert query_durability.ended == 2
+
+
+def test_durable_query_replays_database_errors(query_durability):
+    error = Err(host_postgres.Error_QueryExecutionFailure("syntax error"))
+    connection = FakeQueryConnection(error)
+    with pytest.raises(Err) as live:
+        postgres.durable_query(connection, "SELEC")
+    query_durability.live = False
+    with pytest.raises(Err) as replayed:
+        postgres.durable_query(connection, "SELEC")
+    assert live.value == replayed.value == error
+
+
+class LoggingTransaction:
+    def __init__(self, log: list) -> None:
+        self.log = log
+
+    def execute(self, statement: str, params: list) -> int:
+        self.log.append((statement, [param.value for param in params]))
+        return statement.count("(") - 1
+
+    def query(self, statement: str, params: list):
+        self.log.append((statement, [param.value for param in params]))
+        column = host_postgres.DbColumn(
+            0, "n", host_postgres.DbColumnType_Int8(), "int8"
+        )
+        return host_postgres.DbResult(
+            [column], [host_postgres.DbRow([host_postgres.DbValue_Int8(2)])]
+        )
+
+    def commit(self) -> None:
+        self.log.append("commit")
+
+    def rollback(self) -> None:
+        self.log.append("rollback")
+
+    def __exit__(self, *args) -> None:
+        self.log.append("close")
+
+
+class LoggingConnection:
+    def __init__(self) -> None:
+        self.log: list = []
+
+    def begin_transaction(self) -> LoggingTransaction:
+        self.log.append("begin")
+        return LoggingTransaction(self.log)
+
+
+@pytest.fixture
+def operations(monkeypatch) -> list:
+    from wit_world.imports import host as host_imports
+
+    operations = []
+    monkeypatch.setattr(
+        host_imports, "mark_begin_operation", lambda: operations.append("begin") or 5
+    )
+    monkeypatch.setattr(
+        host_imports, "mark_end_operation", lambda index: operations.append(index)
+    )
+    return operations
+
+
+def test_transaction_flushes_queued_inserts_before_statements(operations):
+    connection = LoggingConnection()
+    with postgres.transaction(connection, max_params=4) as tx:
+        tx.insert("t", ["a", "b"], [1, "x"])
+        tx.execute("UPDATE t SET b = $1", ["y"])
+        tx.insert("t", ["a", "b"], [2, "z"])
+        assert tx.query("SELECT count(*) FROM t") == [(2,)]
+        tx.insert("t", ["a", "b"], [3, "u"])
+        tx.insert("t", ["a", "b"], [4, "v"])
+        tx.insert("u", ["c"], [5])
+    assert connection.log == [
+        "begin",
+        ("INSERT INTO t (a, b) VALUES ($1, $2)", [1, "x"]),
+        ("UPDATE t SET b = $1", ["y"]),
+        ("INSERT INTO t (a, b) VALUES ($1, $2)", [2, "z"]),
+        ("SELECT count(*) FROM t", []),
+        ("INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4)", [3, "u", 4, "v"]),
+        ("INSERT INTO u (c) VALUES ($1)", [5]),
+        "commit",
+        "close",
+    ]
+    assert operations == ["begin", 5]
+
+
+def test_transaction_rolls_back_and_drops_queued_inserts_on_error(operations):
+    connection = LoggingConnection()
+    with pytest.raises(Err):
+        with postgres.transaction(connection) as tx:
+            tx.insert("t", ["a"], [1])
+            raise Err("failed")
+    assert connection.log == ["begin", "rollback", "close"]
+    # the atomic region is not ended, so that it gets re-executed as a whole
+    assert operations == ["begin"]
+
+
+def test_non_atomic_transaction_does_not_mark_an_operation(operations):
+    connection = LoggingConnection()
+    with postgres.transaction(connection, atomic=False) as tx:
+        assert tx.flush() == 0
+    assert connection.log == ["begin", "commit", "close"]
+    assert operations == []
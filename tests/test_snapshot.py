@@ -0,0 +1,216 @@
+import io
+from dataclasses import dataclass
+
+import pytest
+from wit_world.types import Err
+
+from golem_cloud.snapshot import Snapshot, SnapshotReader, SnapshotWriter, merge
+
+
+@dataclass
+class Account:
+    id: str
+    balance: int
+
+
+def test_save_and_load():
+    worker = Snapshot()
+    worker.register("accounts", {"a": Account("a", 10)}, cls=dict[str, Account])
+    worker.register("counter", 3)
+    data = worker.save()
+
+    restored = Snapshot()
+    accounts = restored.register("accounts", {}, cls=dict[str, Account])
+    counter = restored.register("counter", 0)
+    restored.load(data)
+    assert accounts.get() == {"a": Account("a", 10)}
+    assert counter.get() == 3
+    assert restored.generation == worker.generation
+
+
+def test_delta_contains_only_changed_regions():
+    worker = Snapshot()
+    a = worker.register("a", 1)
+    worker.register("b", 2)
+    base = worker.save()
+    assert [name for name, _, _ in SnapshotReader(worker.save_delta()).regions()] == []
+
+    a.set(3)
+    delta = worker.save_delta()
+    assert SnapshotReader(delta).base == SnapshotReader(base).snapshot_id
+    assert [name for name, _, _ in SnapshotReader(delta).regions()] == ["a"]
+
+    restored = Snapshot()
+    restored_a = restored.register("a", 0)
+    restored_b = restored.register("b", 0)
+    restored.load(base)
+    restored.load(delta)
+    assert (restored_a.get(), restored_b.get()) == (3, 2)
+
+
+def test_merge_applies_deltas_in_order():
+    worker = Snapshot()
+    a = worker.register("a", 1)
+    b = worker.register("b", 1)
+    base = worker.save()
+    a.set(2)
+    d1 = worker.save_delta()
+    b.set(2)
+    d2 = worker.save_delta()
+
+    restored = Snapshot()
+    restored_a = restored.register("a", 0)
+    restored_b = restored.register("b", 0)
+    restored.load(merge(base, d1, d2))
+    assert (restored_a.get(), restored_b.get()) == (2, 2)
+
+
+def test_delta_requires_matching_base():
+    worker = Snapshot()
+    worker.register("a", 1)
+    with pytest.raises(ValueError):
+        worker.save_delta()
+    worker.save()
+    delta = worker.save_delta()
+    worker.save()
+    with pytest.raises(Err):
+        worker.load(delta)
+    with pytest.raises(Err):
+        merge(delta)
+
+
+def test_migrations_upgrade_old_versions():
+    old = Snapshot()
+    old.register("account", {"id": "a", "cents": 1050})
+    data = old.save()
+
+    new = Snapshot()
+    account = new.register(
+        "account",
+        Account("", 0),
+        version=2,
+        migrations={1: lambda raw: {"id": raw["id"], "balance": raw["cents"] // 100}},
+    )
+    new.load(data)
+    assert account.get() == Account("a", 10)
+    assert account.is_dirty()
+
+    newer = Snapshot()
+    newer.register("account", Account("", 0), version=3)
+    with pytest.raises(Err):
+        newer.load(data)
+
+    older = Snapshot()
+    older.register("account", {})
+    with pytest.raises(Err):
+        older.load(new.save())
+
+
+def test_unknown_regions_and_corrupted_snapshots_are_rejected():
+    worker = Snapshot()
+    worker.register("a", 1)
+    data = worker.save()
+    with pytest.raises(Err):
+        Snapshot().load(data)
+    restored = Snapshot()
+    restored.register("a", 0)
+    with pytest.raises(Err):
+        restored.load(data[:-4])
+    with pytest.raises(Err):
+        restored.load(b"XXXX" + data[4:])
+
+
+def test_writer_splits_regions_into_chunks():
+    sink = io.BytesIO()
+    with SnapshotWriter(sink, 1, chunk_size=16) as writer:
+        writer.write_region("large", bytes(range(100)), 2)
+        writer.write_region("small", b"x")
+    reader = SnapshotReader(sink.getvalue())
+    assert list(reader.regions()) == [
+        ("large", 2, bytearray(range(100))),
+        ("small", 1, bytearray(b"x")),
+    ]
+
+
+def test_delta_after_loading_delta_keeps_its_regions():
+    worker = Snapshot()
+    a = worker.register("a", {"x": 1})
+    worker.register("b", {"y": 1})
+    base = worker.save()
+    a.set({"x": 2})
+    d1 = worker.save_delta()
+
+    restored = Snapshot()
+    restored.register("a", {"x": 0})
+    b = restored.register("b", {"y": 0})
+    restored.load(base)
+    restored.load(d1)
+    b.set({"y": 2})
+    d2 = restored.save_delta()
+
+    merged = Snapshot()
+    merged_a = merged.register("a", {"x": 0})
+    merged_b = merged.register("b", {"y": 0})
+    merged.load(merge(base, d2))
+    assert merged_a.get() == {"x": 2}
+    assert merged_b.get() == {"y": 2}
+
+
+def test_encoding_is_only_cached_when_enabled():
+    encodings = []
+
+    def encode(value: bytes) -> bytes:
+        encodings.append(value)
+        return value
+
+    snapshot = Snapshot()
+    plain = snapshot.region("plain", b"p", encode, bytes)
+    cached = snapshot.region("cached", b"c", encode, bytes, cache_encoded=True)
+    snapshot.save()
+    snapshot.save()
+    assert encodings == [b"p", b"c", b"p"]
+    assert plain.is_dirty()
+    assert not cached.is_dirty()
+
+    cached.set(b"d")
+    snapshot.save()
+    assert encodings[-2:] == [b"p", b"d"]
+
+
+def test_delta_of_another_base_with_the_same_generation_is_rejected():
+    first = Snapshot()
+    first.register("a", 1)
+    second = Snapshot()
+    b = second.register("a", 2)
+    base = first.save()
+    second.save()
+    assert SnapshotReader(base).generation == 1
+    b.set(3)
+    delta = second.save_delta()
+
+    restored = Snapshot()
+    restored.register("a", 0)
+    restored.load(base)
+    with pytest.raises(Err):
+        restored.load(delta)
+    with pytest.raises(Err):
+        merge(base, delta)
+
+
+def test_later_deltas_apply_to_merged_snapshot():
+    worker = Snapshot()
+    a = worker.register("a", 1)
+    b = worker.register("b", 1)
+    base = worker.save()
+    a.set(2)
+    d1 = worker.save_delta()
+    b.set(2)
+    d2 = worker.save_delta()
+
+    restored = Snapshot()
+    restored_a = restored.register("a", 0)
+    restored_b = restored.register("b", 0)
+    restored.load(merge(base, d1))
+    restored.load(d2)
+    assert (restored_a.get(), restored_b.get()) == (2, 2)
+    assert restored.snapshot_id == worker.snapshot_id
@@ -0,0 +1,46 @@
+from golem_cloud.streams import ChunkedWriter
+
+
+class FakeOutputStream:
+    def __init__(self, permitted: int = 1024) -> None:
+        self.permitted = permitted
+        self.writes: list[bytes] = []
+        self.flushes = 0
+
+    def check_write(self) -> int:
+        return self.permitted
+
+    def write(self, contents: bytes) -> None:
+        self.writes.append(contents)
+
+    def blocking_flush(self) -> None:
+        self.flushes += 1
+
+    def data(self) -> bytes:
+        return b"".join(self.writes)
+
+
+def test_chunked_writer_buffers_at_most_one_chunk():
+    stream = FakeOutputStream()
+    writer = ChunkedWriter(stream, chunk_size=8)
+    assert writer.write(b"a") == 1
+    assert stream.writes == []
+    assert writer.write(b"b" * 30) == 30
+    assert len(writer._buffer) == 7
+    assert stream.writes == [b"a" + b"b" * 7, b"b" * 8, b"b" * 8]
+
+    writer.write(b"c" * 3)
+    assert len(writer._buffer) == 2
+    writer.flush()
+    assert writer._buffer == b""
+    assert stream.flushes == 1
+    assert stream.data() == b"a" + b"b" * 30 + b"c" * 3
+
+
+def test_chunked_writer_writes_whole_chunks_directly():
+    stream = FakeOutputStream(permitted=5)
+    writer = ChunkedWriter(stream, chunk_size=8)
+    writer.write(memoryview(bytes(range(16))))
+    assert writer._buffer == b""
+    assert all(len(write) <= 5 for write in stream.writes)
+    assert stream.data() == bytes(range(16))
@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from wit_world.types import Err, Ok
+
+from golem_cloud import tracing
+from golem_cloud.tracing import OperationStats, TransactionTracer
+from golem_cloud.transaction import fallible_transaction, operation
+
+
+class FakeSpan:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.attributes: dict[str, str] = {}
+        self.finished = False
+
+    def set_attributes(self, attributes) -> None:
+        self.attributes.update(
+            (attribute.key, attribute.value.value) for attribute in attributes
+        )
+
+    def __enter__(self) -> "FakeSpan":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.finished = True
+
+
+@pytest.fixture
+def spans(monkeypatch) -> list[FakeSpan]:
+    spans: list[FakeSpan] = []
+
+    def start_span(name: str) -> FakeSpan:
+        spans.append(FakeSpan(name))
+        return spans[-1]
+
+    # the measured durations are 5, 25, 45, 65, ... ns
+    clock = iter(n * n * 5 for n in range(1000))
+    monkeypatch.setattr(tracing.context, "start_span", start_span)
+    monkeypatch.setattr(tracing.time, "perf_counter_ns", lambda: next(clock))
+    return spans
+
+
+def test_spans_have_the_attributes_of_the_execution(spans):
+    tracer = TransactionTracer()
+    assert tracer.trace("execute", "charge", lambda: Ok(1), attempt=2) == Ok(1)
+    assert [span.name for span in spans] == ["execute charge"]
+    assert spans[0].finished
+    assert spans[0].attributes == {
+        "operation": "charge",
+        "phase": "execute",
+        "attempt": "2",
+        "outcome": "ok",
+        "duration_ns": "5",
+    }
+
+
+def test_failures_and_exceptions_are_counted(spans):
+    tracer = TransactionTracer()
+    tracer.trace("execute", "op", lambda: Ok(1))
+    tracer.trace("execute", "op", lambda: Err("failed"))
+    tracer.trace("compensate", "op", lambda: object())
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        tracer.trace("execute", "op", fail)
+    assert [span.attributes["outcome"] for span in spans] == [
+        "ok",
+        "error",
+        "pending",
+        "exception",
+    ]
+    assert tracer.stats[("op", "execute")] == OperationStats(
+        "op", "execute", count=3, failures=2, total_ns=5 + 25 + 65, max_ns=65
+    )
+    assert tracer.stats[("op", "compensate")].failures == 0
+
+
+def test_summary_orders_by_total_duration(spans):
+    tracer = TransactionTracer(spans=False)
+    tracer.trace("execute", "fast", lambda: Ok(None))
+    tracer.trace("execute", "slow", lambda: Ok(None))
+    tracer.trace("compensate", "fast", lambda: Ok(None))
+    assert spans == []
+    assert [(stats.operation, stats.phase) for stats in tracer.summary()] == [
+        ("fast", "compensate"),
+        ("slow", "execute"),
+        ("fast", "execute"),
+    ]
+    tracer.reset()
+    assert tracer.summary() == []
+
+
+def test_transactions_trace_actions_and_compensating_actions(spans):
+    tracer = TransactionTracer()
+
+    def reserve(item: str):
+        return Err("out of stock") if item == "b" else Ok(item)
+
+    op = operation(reserve, lambda item, _: Ok(None), name="reserve")
+
+    def run(tx):
+        tx.execute(op, "a")
+        return tx.execute(op, "b")
+
+    fallible_transaction(run, tracer)
+    assert [span.name for span in spans] == [
+        "execute reserve",
+        "execute reserve",
+        "compensate reserve",
+    ]
+
+
+def test_async_operations_are_traced(spans):
+    tracer = TransactionTracer()
+
+    async def run():
+        return Err("failed")
+
+    assert asyncio.run(tracer.trace_async("execute", "op", run, 3)) == Err("failed")
+    assert spans[0].attributes["attempt"] == "3"
+    assert tracer.stats[("op", "execute")].failures == 1
@@ -0,0 +1,291 @@
+import asyncio
+import contextlib
+from dataclasses import dataclass
+
+import pytest
+from wit_world.imports import poll
+from wit_world.imports.host import PersistenceLevel_PersistNothing, RetryPolicy
+from wit_world.types import Err, Ok
+
+from golem_cloud import durability, host, transaction
+from golem_cloud.transaction import (
+    Compensation,
+    FailedAndRolledBackCompletely,
+    _run_compensation_chains,
+    async_fallible_transaction,
+    async_infallible_transaction,
+    async_operation,
+    batch_operation,
+    durable_infallible_transaction,
+    fallible_transaction,
+    operation,
+    retry_delay,
+)
+
+
+@dataclass
+class Account:
+    id: str
+    balance: int
+
+
+class FakeDurability:
+    oplog: list[bytes] = []
+    live = True
+    persistence_level: object = "smart"
+
+    def __init__(self, interface, function, function_type) -> None:
+        pass
+
+    def enable_forced_commit(self) -> None:
+        pass
+
+    def is_live(self) -> bool:
+        return FakeDurability.live
+
+    def persist_serialized(self, input: bytes, result: bytes) -> None:
+        FakeDurability.oplog.append(result)
+
+    def replay_serialized(self) -> tuple[bytes, int]:
+        return FakeDurability.oplog.pop(0), 1
+
+
+@pytest.fixture
+def fake_durability(monkeypatch):
+    FakeDurability.oplog = []
+    FakeDurability.live = True
+    FakeDurability.persistence_level = "smart"
+    monkeypatch.setattr(durability, "Durability", FakeDurability)
+    monkeypatch.setattr(
+        host, "get_oplog_persistence_level", lambda: FakeDurability.persistence_level
+    )
+    monkeypatch.setattr(
+        host,
+        "set_oplog_persistence_level",
+        lambda level: setattr(FakeDurability, "persistence_level", level),
+    )
+    monkeypatch.setattr(transaction, "get_oplog_index", lambda: 0)
+    return FakeDurability
+
+
+def test_durable_step_returns_the_same_result_live_and_on_replay(fake_durability):
+    open_account = operation(
+        lambda id: Ok(Account(id, 0)), lambda id, account: Ok(None)
+    )
+
+    def run(tx):
+        return tx.execute(open_account, "a"), tx.execute(open_account, "b", Account)
+
+    live = durable_infallible_transaction(run)
+    fake_durability.live = False
+    replayed = durable_infallible_transaction(run)
+    assert live == replayed == ({"id": "a", "balance": 0}, Account("b", 0))
+
+
+class FakePollable:
+    def __init__(self, pending: "FakePending") -> None:
+        self.pending = pending
+
+    def __exit__(self, *args) -> None:
+        self.pending.dropped = True
+
+
+class FakePending:
+    def __init__(self, name: str, result, log: list[str]) -> None:
+        self.name = name
+        self.result = result
+        self.log = log
+        self.dropped = False
+
+    def subscribe(self) -> FakePollable:
+        return FakePollable(self)
+
+    def get(self):
+        assert self.dropped
+        self.log.append(f"finished {self.name}")
+        return self.result
+
+
+def compensations(group: str, steps, log: list[str]) -> list[Compensation]:
+    # steps: (name, result, pending)
+    def compensate(name, result, pending):
+        log.append(f"started {name}")
+        return FakePending(name, result, log) if pending else result
+
+    op = operation(lambda _: Ok(None), lambda step, _: compensate(*step), group)
+    return [Compensation(op, step, None) for step in steps]
+
+
+@pytest.fixture
+def ready_first(monkeypatch):
+    # only the first pending compensation gets ready in each poll
+    monkeypatch.setattr(poll, "poll", lambda pollables: [0])
+
+
+def test_compensation_chains_run_concurrently(ready_first):
+    log: list[str] = []
+    chains = [
+        compensations("a", [("a2", Ok(None), True), ("a1", Ok(None), True)], log),
+        compensations("b", [("b2", Ok(None), True), ("b1", Ok(None), False)], log),
+    ]
+    assert _run_compensation_chains([iter(chain) for chain in chains], None) is None
+    assert log == [
+        "started a2",
+        "started b2",
+        "finished a2",
+        "started a1",
+        "finished b2",
+        "started b1",
+        "finished a1",
+    ]
+
+
+def test_compensation_failure_stops_new_compensations(ready_first):
+    log: list[str] = []
+    chains = [
+        compensations("a", [("a2", Err("a2"), True), ("a1", Ok(None), True)], log),
+        compensations("b", [("b2", Ok(None), True), ("b1", Ok(None), False)], log),
+    ]
+    failure = _run_compensation_chains([iter(chain) for chain in chains], None)
+    assert failure == Err("a2")
+    assert log == ["started a2", "started b2", "finished a2", "finished b2"]
+
+
+def test_synchronous_compensation_failure(ready_first):
+    log: list[str] = []
+    chain = compensations("a", [("a2", Err("a2"), False), ("a1", Ok(None), False)], log)
+    assert _run_compensation_chains([iter(chain)], None) == Err("a2")
+    assert log == ["started a2"]
+
+
+def test_retry_delay_grows_exponentially_up_to_max_delay():
+    policy = RetryPolicy(10, 100, 1000, 2.0, None)
+    assert [retry_delay(policy, attempt) for attempt in range(1, 7)] == [
+        100,
+        200,
+        400,
+        800,
+        1000,
+        1000,
+    ]
+
+
+def test_retry_delay_adds_bounded_jitter(monkeypatch):
+    policy = RetryPolicy(10, 100, 1000, 2.0, 0.5)
+    monkeypatch.setattr(transaction.random, "random", lambda: 0.0)
+    assert retry_delay(policy, 2) == 200
+    monkeypatch.setattr(transaction.random, "random", lambda: 0.999)
+    assert retry_delay(policy, 2) == 299
+    assert retry_delay(policy, 5) == 1499
+
+
+def logged_async_operation(log: list[str], fail: set[str] = frozenset()):
+    async def execute(name):
+        await asyncio.sleep(0)
+        if name == "raise":
+            raise RuntimeError(name)
+        log.append(f"execute {name}")
+        return Err(name) if name in fail else Ok(name)
+
+    async def compensate(name, result):
+        log.append(f"compensate {name}")
+        return Ok(None)
+
+    return async_operation(execute, compensate)
+
+
+def test_async_fallible_transaction_compensates_gathered_operations():
+    log: list[str] = []
+    op = logged_async_operation(log, fail={"c"})
+
+    async def run(tx):
+        await tx.execute(op, "a")
+        results = await tx.gather((op, "b"), (op, "c"), (op, "d"))
+        assert results == [Ok("b"), Err("c"), Ok("d")]
+        return results[1]
+
+    result = asyncio.run(async_fallible_transaction(run))
+    assert result == Err(FailedAndRolledBackCompletely("c"))
+    assert log[-3:] == ["compensate d", "compensate b", "compensate a"]
+
+
+def test_async_gather_records_compensations_before_raising():
+    log: list[str] = []
+    op = logged_async_operation(log)
+
+    async def run(tx):
+        try:
+            await tx.gather((op, "a"), (op, "raise"), (op, "b"))
+        except RuntimeError as e:
+            assert [c.input for c in tx.compensations] == ["a", "b"]
+            return Err(str(e))
+
+    result = asyncio.run(async_fallible_transaction(run))
+    assert result == Err(FailedAndRolledBackCompletely("raise"))
+    assert log == ["execute a", "execute b", "compensate b", "compensate a"]
+
+
+class Restarted(Exception):
+    pass
+
+
+def test_async_infallible_transaction_rolls_back_and_retries(monkeypatch):
+    log: list[str] = []
+    op = logged_async_operation(log, fail={"c"})
+
+    def set_oplog_index(index):
+        log.append(f"retry from {index}")
+        raise Restarted()
+
+    monkeypatch.setattr(transaction, "atomic_operation_context", contextlib.nullcontext)
+    monkeypatch.setattr(transaction, "get_oplog_index", lambda: 7)
+    monkeypatch.setattr(transaction, "set_oplog_index", set_oplog_index)
+
+    async def run(tx):
+        assert await tx.execute(op, "a") == "a"
+        await tx.gather((op, "b"), (op, "c"))
+
+    with pytest.raises(Restarted):
+        asyncio.run(async_infallible_transaction(run))
+    assert log[-3:] == ["compensate b", "compensate a", "retry from 7"]
+
+
+def test_durable_step_runs_the_operation_without_persisting(fake_durability):
+    levels = []
+
+    def execute(id):
+        levels.append(fake_durability.persistence_level)
+        return Ok(id)
+
+    op = operation(execute, lambda id, result: Ok(None))
+    assert durable_infallible_transaction(lambda tx: tx.execute(op, "a")) == "a"
+    assert levels == [PersistenceLevel_PersistNothing()]
+    assert fake_durability.persistence_level == "smart"
+
+
+def test_failed_batch_compensates_the_earlier_batches():
+    log: list[str] = []
+
+    def execute(batch):
+        log.append(f"execute {batch}")
+        return Err("failed") if 5 in batch else Ok([n * 10 for n in batch])
+
+    def compensate(batch, results):
+        log.append(f"compensate {batch} {results}")
+        return Ok(None)
+
+    op = batch_operation(execute, compensate, batch_size=2)
+    result = fallible_transaction(lambda tx: tx.execute_batch(op, [1, 2, 3, 4, 5]))
+    assert result == Err(FailedAndRolledBackCompletely("failed"))
+    assert log == [
+        "execute [1, 2]",
+        "execute [3, 4]",
+        "execute [5]",
+        "compensate [3, 4] [30, 40]",
+        "compensate [1, 2] [10, 20]",
+    ]
+
+
+def test_batch_size_must_be_positive():
+    with pytest.raises(ValueError):
+        batch_operation(lambda batch: Ok(batch), lambda batch, _: Ok(None), 0)